@@ -49,6 +49,23 @@ def priority_value(row):
     
     return scaling 
 
+def priority_values(priority, days):
+    """
+    Vectorized priority_value: the piecewise priority curve for a whole column of priorities and days,
+    truncated to whole numbers as priority_function does for integer days. Returns NaN for any other priority.
+    """
+    priority_ranges = {
+        'Low': (low_min, low_max),
+        'Medium': (medium_min, medium_max),
+        'High': (high_min, high_max),
+        'EMERGENCY': (emergency_min, emergency_max),
+    }
+    min_priority = pd.Series(priority).map({key: value[0] for key, value in priority_ranges.items()}).to_numpy(dtype=float)
+    max_priority = pd.Series(priority).map({key: value[1] for key, value in priority_ranges.items()}).to_numpy(dtype=float)
+    days = np.asarray(days, dtype=float)
+
+    return np.trunc(np.where(days <= 730, min_priority + days * ((max_priority - min_priority) / 730), max_priority))
+
 def find_cost(row):
     if pd.notnull(row['Final Cost']) and row['Final Cost'] != "":
         return row['Final Cost']
@@ -62,9 +79,46 @@ def find_cost(row):
     else:
         return 0
     
+def find_costs(df):
+    """
+    Vectorized find_cost: Final Cost, else Quoted Cost, else Estimated Cost (1 when it is '0'), else 0.
+    """
+    def has_value(column):
+        return (df[column].notna() & (df[column] != "")).to_numpy()
+
+    estimated = df['Estimated Cost']
+    conditions = [has_value('Final Cost'), has_value('Quoted Cost'),
+                  has_value('Estimated Cost') & (estimated == '0').to_numpy(), has_value('Estimated Cost')]
+    choices = [df['Final Cost'].to_numpy(dtype=object), df['Quoted Cost'].to_numpy(dtype=object), 1, estimated.to_numpy(dtype=object)]
+
+    return pd.Series(np.select(conditions, choices, default=0), index=df.index)
+
+def project_days(open_dates):
+    """
+    Days since each project was opened.
+    """
+    now = pd.Timestamp(date.today())
+    return (now - pd.to_datetime(open_dates)).dt.days
+
+def unit_alpha(values):
+    """
+    Unit value factor per project: the mean replacement value of its units over the average unit value,
+    with occupied units counted at the maximum value.
+    """
+    avg_value = values['replace_value'].mean()
+    max_value = values['replace_value'].max()
+    values = values.copy()
+    values.loc[values['occupied'] == True, 'replace_value'] = max_value
+
+    values = values[['item_id', 'replace_value']]
+
+    alpha = values.groupby(['item_id']).mean()/avg_value
+    alpha = alpha.reset_index()
+    return alpha.rename(columns = {'item_id':'id', 'replace_value':'alpha'})
+
 def calculate_costs(df, buffer=1):
     df = df.copy()
-    df['cost'] = df.apply(find_cost, axis=1)
+    df['cost'] = find_costs(df)
 
     df['Quantity'].fillna(1, inplace=True)
     df['Quantity'].replace('', 1, inplace=True)
@@ -88,46 +142,41 @@ def calculate_costs(df, buffer=1):
     return df
 
 
-def calc_cost_effectiveness(df):
-    now = date.today()
-    # Calculate the number of weeks since 'Open' date
+def score_projects(df, alpha):
+    """
+    Days open, cost, priority_value and cost_effectiveness of each project, with unit projects scaled by
+    alpha (see unit_alpha).
+    """
+    # Calculate the number of days since 'Open' date
     df = df.copy()
-    df.loc[:,'days'] = (now - df['Open']).apply(lambda x: x.days)
+    df.loc[:,'days'] = project_days(df['Open'])
     df['days'] = df['days'].astype(int)
     
     # Calculate the cost for each project
     df = calculate_costs(df)
-    
-    values = add_values_to_projects()
-    avg_value = values['replace_value'].mean()
-    max_value = values['replace_value'].max()
-    values.loc[values['occupied'] == True, 'replace_value'] = max_value
-
-    values = values[['item_id', 'replace_value']]
 
-    alpha = values.groupby(['item_id']).mean()/avg_value
-    alpha = alpha.reset_index()
-    alpha = alpha.rename(columns = {'item_id':'id', 'replace_value':'alpha'})
-
-    # Apply the function to each row of the DataFrame
+    # unit projects are scaled by the value of their units
     mask = df['Task Type'] == 'Unit'
     df_unit = df[mask]
     df_unit = df_unit.merge(alpha, on='id', how='left')
     df_unit['alpha'] = df_unit['alpha'].fillna(1)
-    df_unit['priority_value'] = df_unit.apply(lambda row: priority_value(row), axis=1) * df_unit['alpha']
 
     df_not_unit = df[~mask]
-    df_not_unit['priority_value'] = df_not_unit.apply(lambda row: priority_value(row), axis=1)
 
     # Concatenate the dataframes back together
     df = pd.concat([df_unit, df_not_unit])
+    df['priority_value'] = priority_values(df['Priority'], df['days']) * df['alpha'].fillna(1).to_numpy()
 
     # Calculate cost-effectiveness
-    df['cost_effectiveness'] = np.where(df['cost']=="", 0, np.divide(df['priority_value'], df['cost'], where=df['cost'] !=0))
+    # projects that cost nothing get 0, so they rank after every priced project
+    df['cost_effectiveness'] = np.where(df['cost']=="", 0, np.divide(df['priority_value'], df['cost'], out=np.zeros(len(df)), where=df['cost'] !=0))
 
     # Normalize cost_effectiveness to be out of 100
     df['cost_effectiveness'] = df['cost_effectiveness'].astype(float)
 
+    return df
+
+def rank_projects(df):
     # Rank based on cost_effectiveness from highest to lowest
     df['rank'] = df['cost_effectiveness'].rank(method='first', ascending=False)
 
@@ -140,3 +189,8 @@ def calc_cost_effectiveness(df):
 
     return df
 
+def calc_cost_effectiveness(df, values=None):
+    if values is None:
+        values = add_values_to_projects()
+    df = score_projects(df, unit_alpha(values))
+    return rank_projects(df)
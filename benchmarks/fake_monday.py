@@ -0,0 +1,484 @@
+"""
+Local stand-in for api.monday.com/v2 serving the queries and mutations the Monday classes use,
+plus a generator for synthetic project and Ranking boards.
+"""
+import itertools
+import json
+import re
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pandas as pd
+
+# project board column ids -> titles, RD and Status match the ids query_items reads
+project_board_columns = {
+    'text4': 'RD', 'task_type': 'Task Type', 'project_type': 'Project Type', 'sub_project_type': 'Sub Project Type',
+    'quantity': 'Quantity', 'priority': 'Priority', 'status': 'Status', 'pc': 'PC', 'rl_link': 'RL Link', 'open': 'Open',
+    'scheduled': 'Scheduled', 'estimated_cost': 'Estimated Cost', 'quoted_cost': 'Quoted Cost',
+    'deposit_date': 'Deposit Date', 'deposit_amount': 'Deposit Amount', 'final_cost': 'Final Cost',
+    'dropdown3': 'Task Level',
+}
+project_board_groups = {'north': 'North', 'south': 'South', 'central': 'Central', 'complete': 'Complete'}
+
+# Ranking board column ids -> titles, the ids preprocess_df keeps
+ranking_board_columns = {
+    'name': 'Name', 'rd': 'RD', 'text2': 'Project ID', 'numbers': 'Cost', 'numbers6': 'Rank', 'numbers0': 'RD Budget',
+    'numbers_1': 'Fund Budget', 'status19': 'Status', 'status9': 'Priority', 'numbers1': 'Priority Value',
+    'region5': 'Region', 'text': 'Fund', 'numbers05': 'After RD Budget', 'numbers_15': 'After Fund Budget',
+    'text8': 'PC', 'item_name': 'Item Name', 'link': 'Link', 'exceeds_rd_budget5': 'Exceeds RD Budget',
+    'exceeds_fund_budget2': 'Exceeds Fund Budget',
+}
+ranking_board_groups = {'topics': 'In Process', 'new_group': 'Errors', 'group_title': 'Eligible',
+                        'new_group51572': 'Completed', 'new_group40156': 'Ineligible'}
+status_labels = {11: 'High', 1: 'Medium', 0: 'Low', 2: 'EMERGENCY', 5: ''}
+
+pending_statuses = ['Waiting for Estimate', 'Vendor Needed', 'Quote Requested', 'New Project', 'On Hold']
+in_process_statuses = ['Scheduled', 'In Progress', 'Awaiting Invoice']
+
+
+# --- boards ---
+
+class Board:
+    def __init__(self, board_id, name, columns, groups):
+        self.id = str(board_id)
+        self.name = name
+        self.columns = columns
+        self.groups = groups
+        self.items = {}
+
+    def add_item(self, item_id, name, group_id, values, subitems=None):
+        self.items[str(item_id)] = {'id': str(item_id), 'name': name, 'group_id': group_id,
+                                    'values': values, 'subitems': subitems or []}
+
+
+def generate_boards(n_items, unit_share=0.2, subitems_per_unit=3, ranking_coverage=0.95, stale_share=0.01,
+                    project_board_id=1000, ranking_board_id=2000, seed=0):
+    """
+    Builds a synthetic project board of n_items at the facilities of budgets_2023.csv with project types from
+    cost_matrix.csv, subitems for its unit level items, and a Ranking board already holding ranking_coverage of
+    the projects plus stale_share of items for removed projects, so a run sees deletes, creates, moves and updates.
+    Returns (project_board, ranking_board, unit_tasks) where unit_tasks has one row per subitem task.
+    """
+    rng = np.random.default_rng(seed)
+    cost_matrix = pd.read_csv('cost_matrix.csv')
+    facilities = pd.read_csv('budgets_2023.csv')['RD'].to_numpy()
+    combos = cost_matrix[['Project Type', 'Sub Project Type', 'Task Type']].to_numpy()
+
+    project_board = Board(project_board_id, 'Projects', project_board_columns, project_board_groups)
+    ranking_board = Board(ranking_board_id, 'Ranking', ranking_board_columns, ranking_board_groups)
+    unit_tasks = []
+    next_id = 10 ** 9
+
+    for i in range(n_items):
+        item_id = 10 ** 8 + i
+        rd = str(rng.choice(facilities))
+        project_type, sub_project_type, task_type = combos[rng.integers(len(combos))]
+        is_unit = rng.random() < unit_share
+        group_id = rng.choice(list(project_board_groups), p=[0.13, 0.13, 0.14, 0.6])
+        if group_id == 'complete':
+            status = 'Done'
+        else:
+            status = rng.choice(pending_statuses + in_process_statuses)
+        cost = lambda: '' if rng.random() < 0.5 else str(round(float(rng.uniform(50, 20000)), 2))
+
+        values = {
+            'text4': rd, 'task_type': 'Unit' if is_unit else str(task_type).strip(),
+            'project_type': str(project_type).strip(), 'sub_project_type': str(sub_project_type).strip(),
+            'quantity': str(rng.integers(1, 4)), 'priority': rng.choice(['Low', 'Medium', 'High', 'EMERGENCY'], p=[0.4, 0.4, 0.15, 0.05]),
+            'status': status, 'pc': '', 'rl_link': '',
+            'open': str((pd.Timestamp('2021-01-01') + pd.Timedelta(days=int(rng.integers(0, 1000)))).date()),
+            'scheduled': '', 'estimated_cost': cost(), 'quoted_cost': cost(), 'deposit_date': '', 'deposit_amount': '',
+            'final_cost': cost() if group_id == 'complete' else '',
+            'dropdown3': '{"ids":[1]}' if is_unit else '{"ids":[2]}',
+        }
+
+        subitems = []
+        if is_unit and group_id != 'complete':
+            for _ in range(subitems_per_unit):
+                next_id += 1
+                unit_number = f'{chr(65 + rng.integers(0, 6))}{rng.integers(1, 300)}'
+                subitems.append({'id': str(next_id), 'name': unit_number,
+                                 'values': {'link': f'https://example.com/tasks/{next_id}', 'status_1': ''}})
+                unit_tasks.append({'task_id': next_id, 'rd': rd, 'unit_number': unit_number,
+                                   'occupied': bool(rng.random() < 0.8), 'width': float(rng.choice([5, 10])),
+                                   'length': float(rng.choice([5, 10, 15])), 'unit_type': rng.choice(['cc', 'standard'])})
+
+        project_board.add_item(item_id, f'{rd} - Project {i}', group_id, values, subitems)
+
+        if rng.random() < ranking_coverage:
+            ranking_values = {'rd': rd, 'text2': str(item_id), 'numbers': cost(), 'numbers6': str(rng.integers(1, n_items)),
+                              'numbers0': '0', 'numbers_1': '0', 'status19': status, 'status9': values['priority'],
+                              'numbers1': '0', 'region5': project_board_groups[group_id], 'text': '', 'numbers05': '0',
+                              'numbers_15': '0', 'text8': '', 'item_name': f'Project {i}'}
+            group = 'new_group51572' if group_id == 'complete' else rng.choice(list(ranking_board_groups))
+            ranking_board.add_item(2 * 10 ** 8 + i, f'{rd} - Project {i}', group, ranking_values)
+
+    for i in range(int(n_items * stale_share)):
+        ranking_board.add_item(3 * 10 ** 8 + i, f'Removed Project {i}', 'new_group51572',
+                               {'text2': str(9 * 10 ** 8 + i), 'numbers': '100', 'numbers6': '1', 'numbers0': '0',
+                                'numbers_1': '0', 'numbers1': '0', 'numbers05': '0', 'numbers_15': '0'})
+
+    return project_board, ranking_board, pd.DataFrame(unit_tasks)
+
+
+# --- a small GraphQL reader, enough for the documents the Monday classes send ---
+
+token_pattern = re.compile(r'\s*(?:(\.\.\.)|("(?:[^"\\]|\\.)*")|(-?\d+(?:\.\d+)?)|(\$?\w+)|([{}()\[\]:!,=]))')
+
+
+def tokenize(text):
+    tokens = []
+    position = 0
+    text = text.strip()
+    while position < len(text):
+        match = token_pattern.match(text, position)
+        if not match:
+            raise ValueError(f'Cannot parse query near: {text[position:position + 30]}')
+        spread, string, number, name, punctuation = match.groups()
+        if string is not None:
+            tokens.append(('string', json.loads(string)))
+        elif number is not None:
+            tokens.append(('number', float(number) if '.' in number else int(number)))
+        elif name is not None:
+            tokens.append(('name', name))
+        else:
+            tokens.append(('punct', spread or punctuation))
+        position = match.end()
+        while position < len(text) and text[position].isspace():
+            position += 1
+    return tokens
+
+
+class Parser:
+    def __init__(self, text, variables):
+        self.tokens = tokenize(text)
+        self.position = 0
+        self.variables = variables or {}
+
+    def peek(self):
+        return self.tokens[self.position] if self.position < len(self.tokens) else (None, None)
+
+    def take(self):
+        token = self.peek()
+        self.position += 1
+        return token
+
+    def parse_operation(self):
+        operation = 'query'
+        if self.peek() == ('name', 'query') or self.peek() == ('name', 'mutation'):
+            operation = self.take()[1]
+            if self.peek()[0] == 'name':
+                self.take()
+            if self.peek() == ('punct', '('):
+                # variable definitions are not needed, values come from the variables payload
+                depth = 0
+                while True:
+                    token = self.take()
+                    if token == ('punct', '('):
+                        depth += 1
+                    elif token == ('punct', ')'):
+                        depth -= 1
+                        if depth == 0:
+                            break
+        return operation, self.parse_selection()
+
+    def parse_selection(self):
+        self.take()  # {
+        fields = []
+        while self.peek() != ('punct', '}'):
+            if self.peek() == ('punct', ','):
+                self.take()
+                continue
+            name = self.take()[1]
+            alias = name
+            if self.peek() == ('punct', ':'):
+                self.take()
+                name = self.take()[1]
+            args = {}
+            if self.peek() == ('punct', '('):
+                self.take()
+                while self.peek() != ('punct', ')'):
+                    if self.peek() == ('punct', ','):
+                        self.take()
+                        continue
+                    arg_name = self.take()[1]
+                    self.take()  # :
+                    args[arg_name] = self.parse_value()
+                self.take()
+            selection = self.parse_selection() if self.peek() == ('punct', '{') else None
+            fields.append((alias, name, args, selection))
+        self.take()  # }
+        return fields
+
+    def parse_value(self):
+        kind, value = self.take()
+        if kind == 'punct' and value == '[':
+            values = []
+            while self.peek() != ('punct', ']'):
+                if self.peek() == ('punct', ','):
+                    self.take()
+                    continue
+                values.append(self.parse_value())
+            self.take()
+            return values
+        if kind == 'punct' and value == '{':
+            values = {}
+            while self.peek() != ('punct', '}'):
+                if self.peek() == ('punct', ','):
+                    self.take()
+                    continue
+                key = self.take()[1]
+                self.take()
+                values[key] = self.parse_value()
+            self.take()
+            return values
+        if kind == 'name' and value.startswith('$'):
+            return self.variables.get(value[1:])
+        if kind == 'name' and value in ('true', 'false'):
+            return value == 'true'
+        if kind == 'name' and value == 'null':
+            return None
+        return value
+
+
+def render(value, selection):
+    """
+    Resolves a selection against dict objects whose values may be functions of the field's arguments.
+    """
+    if selection is None or value is None:
+        return value
+    if isinstance(value, list):
+        return [render(entry, selection) for entry in value]
+    result = {}
+    for alias, name, args, sub_selection in selection:
+        field = value.get(name)
+        if callable(field):
+            field = field(args)
+        result[alias] = render(field, sub_selection)
+    return result
+
+
+# --- the server ---
+
+class FakeMonday:
+    """
+    Holds the boards and answers GraphQL requests like api.monday.com/v2.
+    latency is added to every request. Each request costs complexity (a base cost plus one per item returned or
+    changed) from a budget that refills every reset_seconds; requests over budget get a ComplexityException.
+    """
+    def __init__(self, boards, latency=0.0, budget=10_000_000, reset_seconds=60, base_cost=1000, item_cost=100):
+        self.boards = {board.id: board for board in boards}
+        self.latency = latency
+        self.budget = budget
+        self.reset_seconds = reset_seconds
+        self.base_cost = base_cost
+        self.item_cost = item_cost
+        self.window_start = time.monotonic()
+        self.spent = 0
+        self.calls = Counter()
+        self.cursors = {}
+        self.cursor_ids = itertools.count()
+        self.item_ids = itertools.count(4 * 10 ** 8)
+        self.lock = threading.Lock()
+        self.server = None
+
+    # --- object views ---
+
+    def item_view(self, board, item):
+        column_values = lambda args: [
+            {'id': column_id, 'text': item['values'].get(column_id, ''), 'value': item['values'].get(column_id, ''), 'type': 'text'}
+            for column_id in board.columns
+            if not args.get('ids') or column_id in args['ids']
+        ]
+        subitems = lambda args: [
+            {'id': subitem['id'], 'name': subitem['name'],
+             'column_values': lambda args, subitem=subitem: [
+                 {'id': column_id, 'text': text, 'value': text} for column_id, text in subitem['values'].items()
+                 if not args.get('ids') or column_id in args['ids']]}
+            for subitem in item['subitems']
+        ]
+        self.returned += 1
+        return {'id': item['id'], 'name': item['name'], 'state': 'active',
+                'group': {'id': item['group_id'], 'title': board.groups[item['group_id']]},
+                'column_values': column_values, 'subitems': subitems}
+
+    def page(self, board, group_id, offset, limit):
+        items = [item for item in board.items.values() if group_id is None or item['group_id'] == group_id]
+        page_items = items[offset:offset + limit]
+        cursor = None
+        if offset + limit < len(items):
+            cursor = f'cursor-{next(self.cursor_ids)}'
+            self.cursors[cursor] = (board.id, group_id, offset + limit)
+        return {'cursor': cursor, 'items': [self.item_view(board, item) for item in page_items]}
+
+    def group_view(self, board, group_id):
+        return {'id': group_id, 'title': board.groups[group_id], 'archived': False, 'deleted': False, 'color': '',
+                'items': lambda args: [self.item_view(board, item) for item in board.items.values() if item['group_id'] == group_id],
+                'items_page': lambda args: self.page(board, group_id, 0, int(args.get('limit', 25)))}
+
+    def board_view(self, board):
+        def items(args):
+            board_items = list(board.items.values())
+            if args.get('limit'):
+                page = int(args.get('page', 1))
+                board_items = board_items[(page - 1) * args['limit']:page * args['limit']]
+            return [self.item_view(board, item) for item in board_items]
+
+        def groups(args):
+            ids = args.get('ids')
+            ids = [ids] if isinstance(ids, str) else ids
+            return [self.group_view(board, group_id) for group_id in board.groups if not ids or group_id in ids]
+
+        return {'id': board.id, 'name': board.name,
+                'columns': [{'id': column_id, 'title': title, 'type': 'text', 'settings_str': '{}'}
+                            for column_id, title in board.columns.items()],
+                'groups': groups, 'items': items,
+                'items_page': lambda args: self.page(board, None, 0, int(args.get('limit', 25))),
+                'activity_logs': lambda args: []}
+
+    def find_item(self, item_id):
+        for board in self.boards.values():
+            if str(item_id) in board.items:
+                return board, board.items[str(item_id)]
+        raise ValueError(f'Item {item_id} not found')
+
+    # --- root fields ---
+
+    def query_root(self):
+        def boards(args):
+            ids = args.get('ids')
+            ids = ids if isinstance(ids, list) else [ids]
+            return [self.board_view(self.boards[str(board_id)]) for board_id in ids if str(board_id) in self.boards]
+
+        def items(args):
+            views = []
+            for item_id in (args.get('ids') or [])[:int(args.get('limit') or 25)]:
+                for board in self.boards.values():
+                    if str(item_id) in board.items:
+                        views.append(self.item_view(board, board.items[str(item_id)]))
+            return views
+
+        def next_items_page(args):
+            board_id, group_id, offset = self.cursors.pop(args['cursor'])
+            return self.page(self.boards[board_id], group_id, offset, int(args.get('limit', 25)))
+
+        return {'boards': boards, 'items': items, 'next_items_page': next_items_page}
+
+    def column_texts(self, board, column_values):
+        if isinstance(column_values, str):
+            column_values = json.loads(column_values)
+        texts = {}
+        for column_id, value in (column_values or {}).items():
+            if isinstance(value, dict):
+                if 'text' in value:
+                    value = value['text']
+                elif 'index' in value:
+                    value = status_labels.get(value['index'], '')
+                elif 'label' in value:
+                    value = value['label']
+            texts[column_id] = '' if value is None else str(value)
+        return texts
+
+    def mutation_root(self):
+        def create_item(args):
+            board = self.boards[str(args['board_id'])]
+            item_id = str(next(self.item_ids))
+            board.add_item(item_id, args['item_name'], args.get('group_id') or next(iter(board.groups)),
+                           self.column_texts(board, args.get('column_values')))
+            return self.item_view(board, board.items[item_id])
+
+        def move_item_to_group(args):
+            board, item = self.find_item(args['item_id'])
+            item['group_id'] = args['group_id']
+            return self.item_view(board, item)
+
+        def delete_item(args):
+            board, item = self.find_item(args['item_id'])
+            del board.items[item['id']]
+            return {'id': item['id']}
+
+        def change_multiple_column_values(args):
+            board, item = self.find_item(args['item_id'])
+            item['values'].update(self.column_texts(board, args['column_values']))
+            return self.item_view(board, item)
+
+        def change_column_value(args):
+            board, item = self.find_item(args['item_id'])
+            value = args['value']
+            value = json.loads(value) if isinstance(value, str) else value
+            item['values'].update(self.column_texts(board, {args['column_id']: value}))
+            return self.item_view(board, item)
+
+        return {'create_item': create_item, 'move_item_to_group': move_item_to_group, 'delete_item': delete_item,
+                'change_multiple_column_values': change_multiple_column_values,
+                'change_column_value': change_column_value}
+
+    def execute(self, query, variables):
+        with self.lock:
+            if time.monotonic() - self.window_start > self.reset_seconds:
+                self.window_start = time.monotonic()
+                self.spent = 0
+            reset_in = int(self.reset_seconds - (time.monotonic() - self.window_start)) + 1
+            if self.spent >= self.budget:
+                self.calls['rejected'] += 1
+                return {'error_code': 'ComplexityException', 'status_code': 429,
+                        'error_message': f'Complexity budget exhausted, query cost {self.base_cost} budget remaining 0 '
+                                         f'out of {self.budget} reset in {reset_in} seconds'}
+
+            operation, selection = Parser(query, variables).parse_operation()
+            root = self.mutation_root() if operation == 'mutation' else self.query_root()
+            before = self.budget - self.spent
+            self.returned = 0
+            data = {}
+            complexity_fields = None
+            for alias, name, args, sub_selection in selection:
+                if name == 'complexity':
+                    complexity_fields = (alias, sub_selection)
+                    continue
+                self.calls[name] += 1
+                field = root[name]
+                data[alias] = render(field(args), sub_selection)
+
+            cost = self.base_cost + self.item_cost * self.returned
+            self.spent += cost
+            self.calls['requests'] += 1
+            if complexity_fields:
+                alias, sub_selection = complexity_fields
+                data[alias] = render({'query': cost, 'before': before, 'after': self.budget - self.spent,
+                                      'reset_in_x_seconds': reset_in}, sub_selection)
+            return {'data': data}
+
+    def start(self, port=0):
+        """
+        Serves on localhost in a background thread and returns the endpoint url.
+        """
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                time.sleep(fake.latency)
+                try:
+                    response = fake.execute(body['query'], body.get('variables'))
+                except Exception as e:
+                    response = {'errors': [{'message': f'{type(e).__name__}: {e}'}]}
+                payload = json.dumps(response).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return f'http://127.0.0.1:{self.server.server_address[1]}/v2'
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
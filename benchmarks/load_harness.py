@@ -0,0 +1,115 @@
+"""
+Runs the stages of run.py end to end against a local fake of the Monday API and stand-ins for Postgres and S3,
+reporting wall time, API calls and peak memory per stage.
+
+    python -m benchmarks.load_harness --items 5000 --latency 0.05 --output report.json
+
+The fake server runs in this process, so peak memory includes the boards it holds.
+"""
+import argparse
+import contextlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks.fake_monday import FakeMonday, generate_boards
+
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+data_files = ['cost_matrix.csv', 'budgets_2023.csv']
+
+
+def run_stage(name, fake, stand_ins, report, function, *args, verbose=False):
+    """
+    Runs one stage, appending its wall time, call counts and peak memory to report.
+    """
+    api_calls = fake.calls.copy()
+    other_calls = dict(stand_ins.calls)
+    tracemalloc.reset_peak()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(sys.stdout if verbose else open(os.devnull, 'w')):
+        result = function(*args)
+    seconds = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+
+    api_calls = dict(fake.calls - api_calls)
+    other_calls = {key: value - other_calls.get(key, 0) for key, value in stand_ins.calls.items()
+                   if value != other_calls.get(key, 0)}
+    report['stages'].append({'stage': name, 'seconds': round(seconds, 3), 'api_calls': api_calls,
+                             'sql_s3_calls': other_calls, 'peak_memory_mb': round(peak / 2 ** 20, 1)})
+    print(f"{name:<24}{seconds:>9.2f} s{peak / 2 ** 20:>9.1f} MB  {api_calls.get('requests', 0)} requests "
+          f"{ {key: value for key, value in api_calls.items() if key != 'requests'} }")
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--items', type=int, default=1000, help='items on the synthetic project board')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every API request')
+    parser.add_argument('--budget', type=int, default=10_000_000, help='complexity budget per reset window')
+    parser.add_argument('--reset-seconds', type=int, default=60, help='length of the complexity reset window')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='writes the report as JSON to this file')
+    parser.add_argument('--verbose', action='store_true', help="shows the pipeline's own output")
+    args = parser.parse_args(argv)
+    output = os.path.abspath(args.output) if args.output else None
+
+    # the pipeline writes its caches, mirror and journal to the working directory
+    work_dir = tempfile.mkdtemp(prefix='load_harness_')
+    for f in data_files:
+        shutil.copy(os.path.join(repo_dir, f), work_dir)
+    os.chdir(work_dir)
+
+    project_board, ranking_board, unit_tasks = generate_boards(args.items, seed=args.seed)
+    fake = FakeMonday([project_board, ranking_board], latency=args.latency, budget=args.budget,
+                      reset_seconds=args.reset_seconds)
+    os.environ.update({'api_key': 'load-harness', 'board_id': project_board.id, 'new_board_id': ranking_board.id,
+                       'monday_api_url': fake.start()})
+
+    # imported after the environment is set so the Monday clients point at the fake server
+    from benchmarks.stand_ins import StandIns
+    from monday_push_helpers import calc_and_sort, preprocessing, find_existing_rows, board_after_mutations, \
+        plan_board, plan_updates, execute_mutations
+    stand_ins = StandIns(unit_tasks, seed=args.seed)
+    stand_ins.install()
+
+    report = {'items': args.items, 'subitems': len(unit_tasks), 'ranking_items': len(ranking_board.items),
+              'latency': args.latency, 'budget': args.budget, 'stages': []}
+    print(f"{args.items} items, {len(unit_tasks)} subitems, {len(ranking_board.items)} Ranking board items")
+    stage = lambda name, function, *stage_args: run_stage(name, fake, stand_ins, report, function, *stage_args,
+                                                          verbose=args.verbose)
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    open_df, in_process_df, completed_df = stage('calc_and_sort', calc_and_sort)
+    in_process, open_projects, completed = stage('preprocessing', preprocessing, in_process_df, open_df, completed_df)
+    existing_items = stage('find_existing_rows', find_existing_rows)
+
+    board_plan = stage('plan_board', plan_board, completed, in_process, open_projects, existing_items)
+    applied = []
+    failed = stage('board_mutations', execute_mutations, board_plan, None, None, applied)
+    existing_items = stage('board_after_mutations', board_after_mutations, existing_items, applied)
+    update_plan = stage('plan_updates', lambda: plan_updates(in_process, existing_items)
+                        + plan_updates(open_projects, existing_items))
+    failed += stage('update_mutations', execute_mutations, update_plan)
+    tracemalloc.stop()
+
+    report.update({'seconds': round(time.perf_counter() - start, 3), 'api_calls': dict(fake.calls),
+                   'board_mutations': len(board_plan), 'update_mutations': len(update_plan), 'failed': failed})
+    print(f"{'total':<24}{report['seconds']:>9.2f} s  {fake.calls['requests']} requests, "
+          f"{len(board_plan)} board and {len(update_plan)} update mutations, {failed} failed")
+
+    fake.stop()
+    os.chdir(repo_dir)
+    shutil.rmtree(work_dir, ignore_errors=True)
+    if output:
+        with open(output, 'w') as f:
+            json.dump(report, f, indent=2)
+    return report
+
+
+if __name__ == '__main__':
+    main()
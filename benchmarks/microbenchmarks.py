@@ -0,0 +1,194 @@
+"""
+Times the pure scoring and budget functions on generated projects of increasing size and compares them with a
+saved baseline.
+
+    python -m benchmarks.microbenchmarks --save       # records benchmarks/baseline.json
+    python -m benchmarks.microbenchmarks              # flags results slower or bigger than the baseline
+
+Exits with status 1 when anything regressed.
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.load_harness import repo_dir, data_files
+
+# update variables as needed
+sizes = [1000, 10000, 100000] # projects per run
+n_facilities = 200
+repeats = 5 # the fastest of these runs is recorded
+tolerance = 0.25 # slower or bigger than the baseline by more than this is a regression
+baseline_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+funds = ['FAM1', 'FAM2', 'FAM3', 'FAM4', 'Inland', 'RDH II', 'RDH III', 'RDH IV', 'SPH', 'FAM5']
+
+
+def generate_facilities(rng):
+    """
+    Facilities with the columns grab_budgets reads, at the RDs of budgets_2023.csv up to n_facilities.
+    """
+    rds = pd.read_csv('budgets_2023.csv')['RD'].head(n_facilities)
+    return pd.DataFrame({'rd': rds, 'fund': rng.choice(funds, len(rds)),
+                         'fs': [f'Supervisor {i % 20}' for i in range(len(rds))]})
+
+
+def generate_projects(n, facilities, rng):
+    """
+    n projects shaped like the project board after fetch_data, with text costs as Monday returns them.
+    """
+    combos = pd.read_csv('cost_matrix.csv')[['Project Type', 'Sub Project Type', 'Task Type']]
+    combos = combos.apply(lambda column: column.str.strip()).iloc[rng.integers(len(combos), size=n)].reset_index(drop=True)
+
+    def text_costs(share):
+        costs = rng.uniform(50, 20000, n).round(2).astype(str)
+        return np.where(rng.random(n) < share, costs, '')
+
+    facility = rng.integers(len(facilities), size=n)
+    projects = pd.DataFrame({
+        'id': (10 ** 8 + np.arange(n)).astype(str),
+        'RD': facilities['rd'].to_numpy()[facility],
+        'fund': facilities['fund'].to_numpy()[facility],
+        'Priority': rng.choice(['Low', 'Medium', 'High', 'EMERGENCY'], n, p=[0.4, 0.4, 0.15, 0.05]),
+        'Open': (pd.Timestamp('2021-01-01') + pd.to_timedelta(rng.integers(0, 1000, n), unit='D')).strftime('%Y-%m-%d'),
+        'Quantity': rng.integers(1, 4, n).astype(str),
+        'Estimated Cost': text_costs(0.5), 'Quoted Cost': text_costs(0.3), 'Final Cost': text_costs(0.5),
+    })
+    projects = pd.concat([projects, combos], axis=1)
+    projects.loc[rng.random(n) < 0.2, 'Task Type'] = 'Unit'
+    return projects
+
+
+def generate_unit_values(projects, rng, units_per_project=3):
+    """
+    Unit values for the unit level projects, the columns calc_cost_effectiveness reads.
+    """
+    item_ids = np.repeat(projects.loc[projects['Task Type'] == 'Unit', 'id'].to_numpy(), units_per_project)
+    return pd.DataFrame({'item_id': item_ids, 'replace_value': rng.uniform(50, 400, len(item_ids)).round(2),
+                         'occupied': rng.random(len(item_ids)) < 0.8})
+
+
+def build_cases(n, seed=0):
+    """
+    Dictionary of benchmark name -> (setup, function). setup() returns fresh arguments for one call so
+    functions that change their input in place see the same data every time.
+    """
+    from algo import calculate_costs, calc_cost_effectiveness
+    from helpers import remaining_facility, remaining_fund
+    from monday_push_helpers import add_cumulative_budget_columns, gathered_budgets
+
+    rng = np.random.default_rng(seed)
+    facilities = generate_facilities(rng)
+    projects = generate_projects(n, facilities, rng)
+    values = generate_unit_values(projects, rng)
+
+    completed = calculate_costs(projects)
+    by_facility = remaining_facility(completed.copy(), facilities)
+    budgets = gathered_budgets(completed.copy(), facilities)
+    scored = calc_cost_effectiveness(projects, values)
+    scored['Capex'] = scored['cost'] > 2500
+    scored = scored.drop(columns=['fund']).merge(
+        budgets[['RD', 'Capex', 'fund', 'remaining_budget', 'remaining_fund_budget']], on=['RD', 'Capex'], how='left')
+    scored = scored.sort_values(by='cost_effectiveness', ascending=False)
+
+    return {
+        'calculate_costs': (lambda: (projects,), calculate_costs),
+        'calc_cost_effectiveness': (lambda: (projects, values), calc_cost_effectiveness),
+        'remaining_facility': (lambda: (completed.copy(), facilities), remaining_facility),
+        'remaining_fund': (lambda: (by_facility,), remaining_fund),
+        'add_cumulative_budget_columns': (lambda: (scored.copy(),), add_cumulative_budget_columns),
+    }
+
+
+def measure(setup, function, repeats=repeats):
+    """
+    Fastest wall time of repeats calls, and the peak memory allocated by one call measured separately so
+    tracing doesn't slow the timed calls.
+    """
+    function(*setup()) # warm up caches such as the budgets file
+    times = []
+    for _ in range(repeats):
+        args = setup()
+        start = time.perf_counter()
+        function(*args)
+        times.append(time.perf_counter() - start)
+
+    args = setup()
+    tracemalloc.start()
+    function(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {'seconds': min(times), 'peak_bytes': peak}
+
+
+def compare(results, baseline, tolerance=tolerance):
+    """
+    Lines describing every result slower or bigger than its baseline by more than tolerance.
+    """
+    regressions = []
+    for key, result in results.items():
+        if key not in baseline:
+            continue
+        for metric in ['seconds', 'peak_bytes']:
+            before, after = baseline[key][metric], result[metric]
+            if before and after > before * (1 + tolerance):
+                regressions.append(f'{key} {metric}: {before:.4g} -> {after:.4g} (+{after / before - 1:.0%})')
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=sizes)
+    parser.add_argument('--repeats', type=int, default=repeats)
+    parser.add_argument('--only', nargs='+', help='benchmark names to run')
+    parser.add_argument('--baseline', default=baseline_path)
+    parser.add_argument('--save', action='store_true', help='writes the results as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=tolerance)
+    args = parser.parse_args(argv)
+    baseline_file = os.path.abspath(args.baseline)
+
+    # calculate_costs reads cost_matrix.csv and the budgets are cached in the working directory
+    work_dir = tempfile.mkdtemp(prefix='microbenchmarks_')
+    for f in data_files:
+        shutil.copy(os.path.join(repo_dir, f), work_dir)
+    os.chdir(work_dir)
+
+    results = {}
+    try:
+        for n in args.sizes:
+            for name, (setup, function) in build_cases(n).items():
+                if args.only and name not in args.only:
+                    continue
+                result = measure(setup, function, args.repeats)
+                results[f'{name}[{n}]'] = result
+                print(f"{name + f'[{n}]':<40}{result['seconds'] * 1000:>10.1f} ms{result['peak_bytes'] / 2 ** 20:>10.1f} MB")
+    finally:
+        os.chdir(repo_dir)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    if args.save:
+        with open(baseline_file, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f'Baseline saved to {baseline_file}')
+        return 0
+
+    if not os.path.exists(baseline_file):
+        print('No baseline to compare with. Run with --save to record one.')
+        return 0
+    with open(baseline_file) as f:
+        regressions = compare(results, json.load(f), args.tolerance)
+    for regression in regressions:
+        print('REGRESSION', regression)
+    print(f'{len(regressions)} regressions against {baseline_file}')
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,78 @@
+"""
+Local stand-ins for run_sql_query, copy_sql_query and grab_s3_file, answering from the synthetic data of
+fake_monday.generate_boards instead of Postgres and S3.
+"""
+import numpy as np
+import pandas as pd
+
+import helpers
+import reference_data
+import sql_queries
+from reference_data import facilities_probe_sql
+from sql_queries import facilities_sql, unit_values_for_tasks_sql
+
+funds = ['FAM1', 'FAM2', 'FAM3', 'FAM4', 'Inland', 'RDH II', 'RDH III', 'RDH IV', 'SPH', 'FAM5']
+last_upload = '2023-10-01'
+
+
+class StandIns:
+    """
+    Answers the pipeline's queries and S3 reads from unit_tasks, counting every call by query or file name.
+    """
+    def __init__(self, unit_tasks, seed=0):
+        rng = np.random.default_rng(seed)
+        rds = pd.read_csv('budgets_2023.csv')['RD']
+        self.unit_tasks = unit_tasks
+        self.facilities = pd.DataFrame({
+            'facility_id': range(1, len(rds) + 1), 'rd': rds,
+            'region': rng.choice(['North', 'South', 'Central'], len(rds)),
+            'fund': rng.choice(funds, len(rds)), 'fs': [f'Supervisor {i % 20}' for i in range(len(rds))],
+            'acquisition_date': pd.Timestamp('2013-01-01') + pd.to_timedelta(rng.integers(0, 4000, len(rds)), unit='D'),
+        })
+        self.facilities['acq_date'] = self.facilities['acquisition_date'].dt.normalize()
+        sizes = unit_tasks[['rd', 'width', 'length', 'unit_type']].drop_duplicates()
+        self.unit_values = sizes.rename(columns={'rd': 'site_code'}).assign(
+            replace_value=rng.uniform(50, 400, len(sizes)).round(2))
+        self.calls = {}
+
+    def count(self, name):
+        self.calls[name] = self.calls.get(name, 0) + 1
+
+    def run_sql_query(self, sql_query, params=None):
+        if sql_query == facilities_sql:
+            self.count('facilities_sql')
+            return self.facilities.copy()
+        if sql_query == facilities_probe_sql:
+            self.count('facilities_probe_sql')
+            return pd.DataFrame([{'facilities': len(self.facilities), 'facilities_updated': last_upload,
+                                  'units': len(self.unit_tasks), 'units_updated': last_upload}])
+        if sql_query == unit_values_for_tasks_sql:
+            self.count('unit_values_for_tasks_sql')
+            tasks = self.unit_tasks[self.unit_tasks['task_id'].isin(params['task_ids'])]
+            return tasks[['task_id', 'rd', 'unit_number', 'occupied', 'width', 'length', 'unit_type']].reset_index(drop=True)
+        raise ValueError('No stand-in for query: ' + sql_query.strip()[:60])
+
+    def copy_sql_query(self, sql_query, dtype=None, params=None):
+        # the same rows with the column types COPY would give
+        df = self.run_sql_query(sql_query, params)
+        return df.astype({column: column_type for column, column_type in (dtype or {}).items()
+                          if column in df.columns and not str(column_type).startswith('datetime')})
+
+    def grab_s3_file(self, f, bucket, idx_col=None, is_json=False):
+        self.count(f)
+        if f == 'unit-value/last_update.json':
+            return {'last_upload': last_upload}
+        if f == f'unit-value/{last_upload}.csv':
+            return self.unit_values.copy()
+        raise ValueError(f'No stand-in for s3://{bucket}/{f}')
+
+    def install(self):
+        """
+        Points the modules that read Postgres and S3 at the stand-ins.
+        """
+        helpers.copy_sql_query = self.copy_sql_query
+        helpers.grab_s3_file = self.grab_s3_file
+        reference_data.run_sql_query = self.run_sql_query
+        # used by run_sql_queries
+        sql_queries.run_sql_query = self.run_sql_query
+        sql_queries.copy_sql_query = self.copy_sql_query
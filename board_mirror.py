@@ -0,0 +1,99 @@
+import json
+import sqlite3
+from datetime import datetime, timedelta, timezone
+
+# update variables as needed
+mirror_path = 'project_board.sqlite'
+full_sync_days = 7 # days between full consistency checks against the board
+sync_overlap = timedelta(minutes=5) # re-reads a few minutes of activity log to cover clock drift
+
+
+class BoardMirror:
+    """
+    Local SQLite copy of the project board.
+    The first sync, and one every full_sync_days, reads the whole board and replaces the mirror so deletions are
+    caught. Other syncs read the board's activity log since the last sync and re-fetch only the items it mentions.
+    Items and sync state are kept per board, so pointing monday at another board starts with a full sync.
+    """
+    def __init__(self, monday, path=mirror_path):
+        self.monday = monday
+        self.board_id = str(monday.board_id)
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        columns = [column for _, column, *_ in self.conn.execute('pragma table_info(sync_state)')]
+        if columns and 'board_id' not in columns:
+            # mirror from before items were kept per board, the next sync rebuilds it
+            self.conn.execute('drop table items')
+            self.conn.execute('drop table sync_state')
+        self.conn.execute('create table if not exists items (board_id text, id text, region text, row text, '
+                          'primary key (board_id, id))')
+        self.conn.execute('create table if not exists sync_state (board_id text, key text, value text, '
+                          'primary key (board_id, key))')
+        self.conn.commit()
+
+    def _get_state(self, key):
+        result = self.conn.execute('select value from sync_state where board_id = ? and key = ?',
+                                   (self.board_id, key)).fetchone()
+        return datetime.fromisoformat(result[0]) if result else None
+
+    def _set_state(self, key, value):
+        self.conn.execute('insert or replace into sync_state (board_id, key, value) values (?, ?, ?)',
+                          (self.board_id, key, value.isoformat()))
+
+    def sync(self, group_titles=['North', 'South', 'Central', 'Complete']):
+        """
+        Brings the mirror up to date with the board.
+        """
+        started = datetime.now(timezone.utc)
+        last_sync = self._get_state('last_sync')
+        last_full_sync = self._get_state('last_full_sync')
+
+        if last_sync is None or last_full_sync is None or started - last_full_sync > timedelta(days=full_sync_days):
+            self.full_sync(group_titles)
+            self._set_state('last_full_sync', started)
+        else:
+            self.delta_sync(last_sync - sync_overlap)
+
+        self._set_state('last_sync', started)
+        self.conn.commit()
+
+    def full_sync(self, group_titles):
+        print('Full sync of the project board mirror...')
+        self.conn.execute('delete from items where board_id = ?', (self.board_id,))
+        # each page is stored as it arrives, the mirror only takes effect when sync commits
+        count = 0
+        for rows in self.monday.project_row_pages(group_titles):
+            self._upsert(rows)
+            count += len(rows)
+        print(f'{count} items mirrored.')
+
+    def delta_sync(self, since):
+        print(f'Syncing project board changes since {since.isoformat()}...')
+        item_ids = self.monday.fetch_changed_item_ids(self.monday.board_id, since.isoformat())
+        if not item_ids:
+            print('No changes.')
+            return
+
+        column_names, column_ids = self.monday.project_column_ids()
+        items = self.monday.fetch_items_by_ids(item_ids, column_ids)
+        active = [item for item in items if item.get('state', 'active') == 'active']
+
+        # anything the log mentions that is no longer active was deleted or archived
+        removed = item_ids - {item['id'] for item in active}
+        self.conn.executemany('delete from items where board_id = ? and id = ?',
+                              [(self.board_id, item_id) for item_id in removed])
+        self._upsert([self.monday.parse_item(item, column_names) for item in active])
+        print(f'{len(active)} items updated, {len(removed)} removed.')
+
+    def _upsert(self, rows):
+        self.conn.executemany('insert or replace into items (board_id, id, region, row) values (?, ?, ?, ?)',
+                              [(self.board_id, row['id'], row['region'], json.dumps(row)) for row in rows])
+
+    def load(self, group_titles=['North', 'South', 'Central', 'Complete']):
+        """
+        Project board DataFrame for the requested groups, read from the mirror.
+        """
+        placeholders = ', '.join('?' for _ in group_titles)
+        result = self.conn.execute(f'select row from items where board_id = ? and region in ({placeholders})',
+                                   [self.board_id] + list(group_titles))
+        return self.monday.project_board_df(json.loads(row) for row, in result)
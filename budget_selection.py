@@ -0,0 +1,156 @@
+import time
+import numpy as np
+
+# update variables as needed
+max_cells = 10000 # budget steps per fund in the knapsack tables, costs are rounded up to fund budget / max_cells
+time_limit = 10 # seconds, funds not solved by then are filled in cost_effectiveness order instead
+always_eligible = ['EMERGENCY', 'High'] # eligible whatever the budget (see plan_board), their costs are taken first
+
+
+def knapsack(weights, values, capacity):
+    """
+    0/1 knapsack over integer weights.
+    Returns (best, keep): best[c] is the best total value with total weight at most c, and keep[i, c] tells if
+    item i is taken in the best choice of the first i + 1 items at capacity c.
+    """
+    best = np.zeros(capacity + 1)
+    keep = np.zeros((len(weights), capacity + 1), dtype=bool)
+    for i, (weight, value) in enumerate(zip(weights, values)):
+        if value <= 0 or weight > capacity:
+            continue
+        if weight == 0:
+            best += value
+            keep[i] = True
+            continue
+        candidate = best[:-weight] + value
+        better = candidate > best[weight:]
+        best[weight:] = np.where(better, candidate, best[weight:])
+        keep[i, weight:] = better
+    return best, keep
+
+
+def knapsack_items(weights, keep, capacity):
+    """
+    Positions of the items taken in the best choice at capacity, read back from knapsack's keep table.
+    """
+    taken = []
+    for i in range(len(weights) - 1, -1, -1):
+        if keep[i, capacity]:
+            taken.append(i)
+            capacity -= weights[i]
+    return taken
+
+
+def select_fund(projects, rd_capacity, fund_capacity, deadline=None):
+    """
+    Best selection within one fund and Capex group, where every RD has its own budget and all of them share the
+    fund's budget. Each RD is solved as a knapsack, then the RDs' best value per spend are combined so the fund
+    budget goes where it buys the most priority value.
+    Returns the index labels of the selected projects, or None if time.monotonic() passed deadline first.
+    """
+    capacity = min(fund_capacity, sum(rd_capacity.values()))
+    if capacity <= 0:
+        return list(projects.index[projects['cost'] <= 0])
+    unit = max(capacity / max_cells, 1) # whole dollars when the budget is small enough
+    cells = int(capacity / unit + 1e-6)
+
+    rds = []
+    combined = np.zeros(cells + 1) # best value over the RDs so far for each fund spend
+    better = np.empty(cells + 1, dtype=bool)
+    for rd, rd_projects in projects.groupby(projects['RD'].fillna(''), sort=False):
+        if deadline is not None and time.monotonic() > deadline:
+            return None
+        # costs are rounded up so a selection never goes over budget
+        weights = np.ceil(rd_projects['cost'].to_numpy() / unit - 1e-6).astype(int)
+        rd_cells = min(int(rd_capacity.get(rd, 0) / unit + 1e-6), cells)
+        best, keep = knapsack(weights, rd_projects['priority_value'].to_numpy(), rd_cells)
+
+        # combined[c] = max over the RD's spend s of previous[c - s] + best[s]
+        previous = combined
+        combined = previous + best[0]
+        spend = np.zeros(cells + 1, dtype=int)
+        for s in range(1, rd_cells + 1):
+            if best[s] == best[s - 1]:
+                continue # spending more here buys nothing
+            # in place, this loop runs up to cells times per RD
+            candidate = previous[:cells + 1 - s] + best[s]
+            np.greater(candidate, combined[s:], out=better[s:])
+            np.copyto(combined[s:], candidate, where=better[s:])
+            np.copyto(spend[s:], s, where=better[s:])
+        rds.append((rd_projects, weights, keep, spend))
+
+    selected = []
+    c = cells
+    for rd_projects, weights, keep, spend in reversed(rds):
+        s = spend[c]
+        selected += [rd_projects.index[i] for i in knapsack_items(weights, keep, s)]
+        c -= s
+    return selected
+
+
+def optimal_budget_columns(df):
+    """
+    Alternative to add_cumulative_budget_columns that picks the projects to fund by maximising their total
+    priority_value, instead of taking them in cost_effectiveness order until the budget runs out.
+    A project draws on both its facility's and its fund's Capex or R&M budget, and neither may go negative.
+    EMERGENCY and High projects are taken first whatever they cost. Costs are rounded up to a budget step, so the
+    result is optimal up to that rounding and any budget left over is then filled in cost_effectiveness order.
+
+    Funds still unsolved after time_limit seconds are filled in cost_effectiveness order like the leftover budget.
+
+    Returns the same columns as add_cumulative_budget_columns, with the cumulative costs per facility or fund and
+    Capex. For selected projects they only count selected projects, so their remaining budgets stay at or above
+    zero unless always eligible projects overspent. For other projects they are the whole selection's cost plus
+    their own, so at least one of their remaining budgets is negative.
+    """
+    df = df.copy()
+    df['remaining_budget'] = df['remaining_budget'].fillna(0).astype(int)
+    df['remaining_fund_budget'] = df['remaining_fund_budget'].fillna(0).astype(int)
+    cost = df['cost'].fillna(0)
+    rd_key = [df['RD'].fillna(''), df['Capex']]
+    fund_key = [df['fund'].fillna(''), df['Capex']]
+
+    forced = df['Priority'].isin(always_eligible)
+    selected = forced.copy()
+
+    # budgets left after the always eligible projects, per facility and per fund
+    rd_spent = cost[forced].groupby([key[forced] for key in rd_key]).sum().to_dict()
+    fund_spent = cost[forced].groupby([key[forced] for key in fund_key]).sum().to_dict()
+    rd_budget = df.groupby(rd_key)['remaining_budget'].first().to_dict()
+    fund_budget = df.groupby(fund_key)['remaining_fund_budget'].first().to_dict()
+
+    candidates = df[~forced].assign(cost=cost, priority_value=df['priority_value'].fillna(0))
+    deadline = time.monotonic() + time_limit
+    unsolved = 0
+    for (fund, capex), projects in candidates.groupby([key[~forced] for key in fund_key], sort=False):
+        rd_capacity = {rd: max(rd_budget[(rd, capex)] - rd_spent.get((rd, capex), 0), 0) for rd in projects['RD'].fillna('').unique()}
+        fund_capacity = max(fund_budget[(fund, capex)] - fund_spent.get((fund, capex), 0), 0)
+        taken = select_fund(projects, rd_capacity, fund_capacity, deadline)
+        if taken is None:
+            unsolved += 1
+            continue
+        selected[taken] = True
+    if unsolved:
+        print(f'Optimal selection hit its {time_limit} second limit, {unsolved} fund budgets are filled in cost effectiveness order.')
+
+    # rounding can leave room for a few more projects, and unsolved funds are filled here
+    rd_spent = cost[selected].groupby([key[selected] for key in rd_key]).sum().to_dict()
+    fund_spent = cost[selected].groupby([key[selected] for key in fund_key]).sum().to_dict()
+    for index in df.index[~selected]:
+        rd, fund = (rd_key[0][index], df.at[index, 'Capex']), (fund_key[0][index], df.at[index, 'Capex'])
+        if cost[index] <= min(rd_budget[rd] - rd_spent.get(rd, 0), fund_budget[fund] - fund_spent.get(fund, 0)):
+            selected[index] = True
+            rd_spent[rd] = rd_spent.get(rd, 0) + cost[index]
+            fund_spent[fund] = fund_spent.get(fund, 0) + cost[index]
+
+    selected_cost = cost.where(selected, 0)
+    rd_total = selected_cost.groupby(rd_key).transform('sum')
+    fund_total = selected_cost.groupby(fund_key).transform('sum')
+    df['cumulative_cost'] = np.where(selected, selected_cost.groupby(rd_key).cumsum(), rd_total + cost).astype(int)
+    df['cumulative_fund_cost'] = np.where(selected, selected_cost.groupby(fund_key).cumsum(), fund_total + cost).astype(int)
+    df['remaining_budget_by_rd'] = (df['remaining_budget'] - df['cumulative_cost']).astype(int)
+    df['remaining_budget_by_fund'] = (df['remaining_fund_budget'] - df['cumulative_fund_cost']).astype(int)
+    return df.rename(columns={
+        'remaining_budget': 'current_rd_budget_status',
+        'remaining_fund_budget': 'current_fund_budget_status'
+    })
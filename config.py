@@ -0,0 +1,13 @@
+import os
+from functools import lru_cache
+
+
+@lru_cache(maxsize=None)
+def load_env():
+    # .env is read once per process, the first time a setting is needed
+    from dotenv import load_dotenv
+    load_dotenv()
+
+def getenv(name):
+    load_env()
+    return os.getenv(name)
@@ -1,47 +1,104 @@
 import pandas as pd
-from dotenv import load_dotenv
 import os 
-import boto3 
+from functools import lru_cache
 import numpy as np
 import json  
+import re
 from io import StringIO    
-from monday_functions import Monday
-from sql_queries import run_sql_query, units_sql, tasks_to_units
+from config import getenv
+from instrumentation import call
+from monday_functions import get_monday
+from sql_queries import copy_sql_query, unit_values_for_tasks_sql, unit_values_for_tasks_dtypes
+from reference_data import get_budgets
 
 capex_threshold = 2500
-monday_data = Monday()
-load_dotenv()
-MASTER_ACCESS_KEY = os.getenv("MASTER_ACCESS_KEY")
-MASTER_SECRET = os.getenv("MASTER_SECRET")
-board_id = os.getenv('board_id')
 
+s3_cache_dir = 's3_cache' # local copies of S3 objects, revalidated with their ETag
+
+@lru_cache(maxsize=None)
 def s3_init():  
+    # boto3 is slow to import, so it's only loaded when S3 is used
+    import boto3 
     
-    # --- s3 client --- 
+    # --- s3 client, shared by every call --- 
     s3 = boto3.client('s3', region_name = 'us-west-1', 
-          aws_access_key_id=MASTER_ACCESS_KEY, 
-          aws_secret_access_key=MASTER_SECRET) 
+          aws_access_key_id=getenv("MASTER_ACCESS_KEY"), 
+          aws_secret_access_key=getenv("MASTER_SECRET")) 
     return s3 
+
+def s3_cache_path(bucket, f):
+    return os.path.join(s3_cache_dir, bucket, f)
+
+def remove_stale_parsed(path, etag):
+    """
+    Deletes the pickles grab_s3_file parsed from earlier versions of the cached object at path.
+    """
+    directory, name = os.path.split(path)
+    stale = re.compile(r'%s\.(?!%s\.)[0-9a-f]{32}(-\d+)?\..*\.pkl$' % (re.escape(name), re.escape(etag.strip('"'))))
+    for cached in os.listdir(directory):
+        if stale.match(cached):
+            os.remove(os.path.join(directory, cached))
+
+def fetch_s3_object(f, bucket):
+    """
+    Returns (body, etag) of an S3 object, using the local copy when S3 says it has not changed.
+    """
+    from botocore.exceptions import ClientError
+    path = s3_cache_path(bucket, f)
+    etag = None
+    if os.path.exists(path) and os.path.exists(path + '.etag'):
+        with open(path + '.etag') as etag_file:
+            etag = etag_file.read()
+
+    s3 = s3_init()
+    with call('s3', f) as record:
+        try:
+            if etag is None:
+                response = s3.get_object(Bucket=bucket, Key=f)
+            else:
+                response = s3.get_object(Bucket=bucket, Key=f, IfNoneMatch=etag)
+        except ClientError as e:
+            if e.response['Error']['Code'] not in ('304', 'NotModified'):
+                raise
+            record['not_modified'] = True
+            with open(path, 'rb') as cached:
+                return cached.read(), etag
+
+        body = response['Body'].read()
+        record['bytes'] = len(body)
+    etag = response['ETag']
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as cached:
+        cached.write(body)
+    with open(path + '.etag', 'w') as etag_file:
+        etag_file.write(etag)
+    remove_stale_parsed(path, etag)
+    return body, etag
     
 def grab_s3_file(f, bucket, idx_col=None, is_json=False):
-    s3 = s3_init()
-    data = s3.get_object(Bucket=bucket, Key=f)['Body'].read().decode('utf-8') 
+    body, etag = fetch_s3_object(f, bucket)
     
     # Check if the file is a JSON
     if is_json:
-        return json.loads(data)  # Return the parsed JSON data as a dictionary
+        return json.loads(body.decode('utf-8'))  # Return the parsed JSON data as a dictionary
     
+    # parsed CSVs are kept as pickles next to the cached file, keyed by ETag
+    parsed_path = '%s.%s.%s.pkl' % (s3_cache_path(bucket, f), etag.strip('"'), idx_col)
+    if os.path.exists(parsed_path):
+        return pd.read_pickle(parsed_path)
+
     # If the file is a CSV
+    data = body.decode('utf-8')
     if idx_col is None:
         data = pd.read_csv(StringIO(data)) 
     else:
         data = pd.read_csv(StringIO(data), index_col=idx_col)
 
+    data.to_pickle(parsed_path)
     return data 
 
-def grab_unit_values():
-    json_data=grab_s3_file('unit-value/last_update.json','rev-mgt',is_json=True)
-    last_upload_date = json_data["last_upload"]
+@lru_cache(maxsize=None)
+def _unit_values(last_upload_date):
     csv_file_name = f"unit-value/{last_upload_date}.csv"
     data = grab_s3_file(csv_file_name, 'rev-mgt')
     data = data.rename(columns={'site_code':'RD'})
@@ -49,30 +106,36 @@ def grab_unit_values():
     
     return data
 
+def grab_unit_values():
+    json_data=grab_s3_file('unit-value/last_update.json','rev-mgt',is_json=True)
+    last_upload_date = json_data["last_upload"]
+    # the same upload is only read once per process
+    return _unit_values(last_upload_date).copy()
+
 def add_values_to_projects():
     values= grab_unit_values()
     assert not values.empty, "values DataFrame is empty."
     
-    unit_projects = monday_data.generate_subitem_df(board_id)
+    unit_projects = get_monday().generate_subitem_df(getenv('board_id'))
     assert not unit_projects.empty, "unit_projects DataFrame is empty."
     unit_projects['task_id'] = pd.to_numeric(unit_projects['link'].str.split('/').str[-1], errors='coerce').fillna(0).astype('int64')
     
-    units_to_tasks = run_sql_query(tasks_to_units)
-    units_to_tasks = units_to_tasks.rename(columns={'site_code':'RD'})
-    unit_projects = unit_projects.merge(units_to_tasks, how='left', on=['task_id'])
-
-    units = run_sql_query(units_sql)
-    assert not units.empty, "units DataFrame is empty."
+    # only the units of these tasks are read, joined in Postgres
+    task_ids = [int(task_id) for task_id in unit_projects['task_id'].unique()]
+    units = copy_sql_query(unit_values_for_tasks_sql, unit_values_for_tasks_dtypes, params={'task_ids': task_ids})
+    if units.empty:
+        # the unit projects are then scored without a unit value factor
+        print('Warning: no subitem links to a unit task, unit values are not used.')
     
     units = units.rename(columns={'rd':'RD'})
-    unit_projects = unit_projects.merge(units, how="left", on=['RD', 'unit_number'])
+    unit_projects = unit_projects.merge(units, how="left", on=['task_id'])
     unit_value_data = unit_projects.merge(values, how="left", on=['RD','width','length','unit_type'])
 
     return unit_value_data
 
 
 def grab_budgets(facilities):
-    budget = pd.read_csv('budgets_2023.csv')
+    budget = get_budgets()
     # budget = grab_s3_file('budgets_2023.csv', bucket ='capex-rm-optimization') #switch later
 
     facility_data = facilities[['rd', 'fund', 'fs']]
@@ -119,7 +182,7 @@ def remaining_fund(remaining_by_facility):
 
 def categorize_projects(df, pending_statuses):
     # Initial categorization based on 'Status'
-    df['project_category'] = df['Status'].apply(lambda x: 'pending' if x in pending_statuses else 'in_process')
+    df['project_category'] = np.where(df['Status'].isin(pending_statuses), 'pending', 'in_process')
     
     # Overwrite 'project_category' for rows where 'Priority' is 'EMERGENCY'
     df.loc[df['Priority'] == 'EMERGENCY', 'project_category'] = 'in_process'
@@ -0,0 +1,165 @@
+from datetime import date
+import os
+import numpy as np
+import pandas as pd
+from algo import calculate_costs, score_projects, rank_projects, unit_alpha
+from helpers import add_values_to_projects, categorize_projects, remaining_facility
+from reference_data import get_facilities
+import monday_push_helpers
+from monday_push_helpers import fund_budgets, merge_budgets, add_cumulative_budget_columns, select_projects, \
+    split_data, pending_statuses
+
+# update variables as needed
+state_path = 'ranking_state.pkl'
+full_ranking_days = 1 # days between full rankings, which also refresh unit values and facilities
+report_columns = ['project_category', 'rank', 'current_rd_budget_status', 'current_fund_budget_status',
+                  'remaining_budget_by_rd', 'remaining_budget_by_fund']
+
+
+def changed_projects(previous, current):
+    """
+    ids of the projects added or changed between two project boards, and ids of the projects removed.
+    """
+    previous = previous.drop_duplicates('id').set_index('id')
+    current = current.drop_duplicates('id').set_index('id')
+    common = current.index.intersection(previous.index)
+    differs = (current.loc[common, current.columns].astype(str) != previous.loc[common, current.columns].astype(str)).any(axis=1)
+    changed = current.index.difference(previous.index).union(common[differs.to_numpy()])
+    return changed, previous.index.difference(current.index)
+
+
+def unchanged_rows(df, ids, changed):
+    # rows of a previous result for projects still on the board and not changed
+    if df is None:
+        return None
+    return df[df['id'].isin(ids) & ~df['id'].isin(changed)]
+
+
+def rank_changes(previous, current, columns=report_columns):
+    """
+    One row per project and report column that differs between two rankings, plus a row for every project
+    added to or removed from them.
+    """
+    previous = previous.drop_duplicates('id').set_index('id')[columns]
+    current = current.drop_duplicates('id').set_index('id')[columns]
+    common = current.index.intersection(previous.index)
+    before, after = previous.loc[common], current.loc[common]
+    rows, columns = np.nonzero(((before != after) & ~(before.isna() & after.isna())).to_numpy())
+    changed = pd.DataFrame({
+        'id': common[rows], 'change': 'changed', 'column': before.columns[columns],
+        'previous': before.to_numpy()[rows, columns], 'current': after.to_numpy()[rows, columns],
+    })
+    added = pd.DataFrame({'id': current.index.difference(previous.index), 'change': 'added'})
+    removed = pd.DataFrame({'id': previous.index.difference(current.index), 'change': 'removed'})
+    return pd.concat([changed, added, removed], ignore_index=True)
+
+
+class RankingState:
+    """
+    Scored state of the last ranking, saved to state_path so the next run can re-rank only what changed.
+    Given the changed, added or removed projects (found by comparing with the last project board when not given),
+    an update recomputes the budgets of the facilities those projects are in, the budget columns of every project
+    in those facilities' funds, and the cost effectiveness of the changed projects only. Ranks are then redone over
+    the whole frames. A new day changes every project's days open, so the first update of a day scores every project
+    again, without fetching anything. Unit values and facilities are refreshed by a full ranking every
+    full_ranking_days; until then new unit projects count their units at the average value.
+    """
+    def __init__(self, path=state_path):
+        self.path = path
+        self.state = pd.read_pickle(path) if os.path.exists(path) else None
+        self.changes = None
+
+    def needs_full_ranking(self, project_board):
+        if self.state is None or (date.today() - self.state['ranked_on']).days >= full_ranking_days:
+            return True
+        # a new board column or a changed selection method makes every saved result stale
+        return (list(project_board.columns) != list(self.state['project_board'].columns)
+                or self.state['selection_method'] != monday_push_helpers.selection_method)
+
+    def update(self, completed_df, open_df, changed=None, removed=None):
+        """
+        Ranks the projects fetched by fetch_data and returns the same frames as calc_and_sort.
+        self.changes holds the projects whose rank or budget columns changed since the last run.
+        """
+        project_board = pd.concat([completed_df, open_df], ignore_index=True)
+        today = date.today()
+        if self.needs_full_ranking(project_board):
+            print('Ranking every project...')
+            previous = {}
+            state = {'ranked_on': today, 'alpha': unit_alpha(add_values_to_projects()), 'facilities': get_facilities()}
+            changed, removed = pd.Index(project_board['id']), pd.Index([])
+        else:
+            previous = state = self.state
+            if changed is None:
+                changed, removed = changed_projects(state['project_board'], project_board)
+            changed, removed = pd.Index(changed), pd.Index(removed if removed is not None else [])
+            print(f'Re-ranking {len(changed)} changed and {len(removed)} removed projects...')
+        rescore = previous.get('scored_on') != today # days open changed, so every open project is scored again
+        facilities = state['facilities']
+        ids = project_board['id']
+
+        open_df = categorize_projects(open_df.copy(), pending_statuses)
+        df_in_process, df_pending = split_data(open_df)
+
+        # facilities whose spending or projects changed, before or after the change, and the funds they're in
+        touched = changed.union(removed)
+        rds = [project_board.loc[ids.isin(touched), 'RD']]
+        rds += [previous[name].loc[previous[name]['id'].isin(touched), 'RD'] for name in ['completed', 'in_process', 'open'] if name in previous]
+        if not previous:
+            rds.append(facilities['rd'])
+        rds = pd.concat(rds).unique()
+        funds = facilities.loc[facilities['rd'].isin(rds), 'fund'].dropna().unique()
+
+        completed = calculate_costs(completed_df[completed_df['id'].isin(changed)], buffer=1)
+        completed['completed'] = True
+        completed = pd.concat([unchanged_rows(previous.get('completed'), ids, changed), completed], ignore_index=True)
+
+        # budgets of the affected facilities, then every fund's budget from them
+        affected_facilities = facilities[facilities['rd'].isin(rds)]
+        spent = completed[completed['RD'].isin(rds)].copy()
+        completed_by_facility = remaining_facility(spent, affected_facilities)
+        completed = pd.concat([completed[~completed['RD'].isin(rds)], spent])
+        completed = completed.set_index('id').loc[completed_df['id']].reset_index()
+        completed['Capex'] = completed['Capex'].astype(bool)
+        expected_by_facility = remaining_facility(
+            pd.concat([spent, df_in_process.loc[df_in_process['RD'].isin(rds), ['RD', 'Final Cost']]], ignore_index=True),
+            affected_facilities)
+        if previous:
+            completed_by_facility = pd.concat([previous['completed_by_facility'].loc[lambda df: ~df['RD'].isin(rds)], completed_by_facility])
+            expected_by_facility = pd.concat([previous['expected_by_facility'].loc[lambda df: ~df['RD'].isin(rds)], expected_by_facility])
+        completed_budgets = fund_budgets(completed_by_facility)
+        expected_budgets = fund_budgets(expected_by_facility)
+
+        state = {**state, 'project_board': project_board, 'completed': completed, 'scored_on': today,
+                 'selection_method': monday_push_helpers.selection_method,
+                 'completed_by_facility': completed_by_facility, 'expected_by_facility': expected_by_facility}
+        results = {}
+        for name, df, budgets in [('in_process', df_in_process, completed_budgets), ('open', df_pending, expected_budgets)]:
+            # cost effectiveness of the changed projects, or of all of them on a new day
+            scored = df if rescore else df[df['id'].isin(changed)]
+            scored = score_projects(scored, state['alpha'])
+            scores = pd.concat([unchanged_rows(previous.get(f'{name}_scores'), df['id'], scored['id']), scored], ignore_index=True)
+            state[f'{name}_scores'] = scores
+
+            # budget columns of every project in an affected fund, kept for the rest
+            if rescore:
+                affected = pd.Series(True, index=scores.index)
+            else:
+                affected = scores['RD'].isin(rds) | scores['RD'].isin(facilities.loc[facilities['fund'].isin(funds), 'rd'])
+            recomputed = merge_budgets(scores[affected].drop(columns=['rank'], errors='ignore'), budgets)
+            recomputed = add_cumulative_budget_columns(recomputed) if name == 'in_process' else select_projects(recomputed)
+            df = pd.concat([unchanged_rows(previous.get(name), df['id'], scores.loc[affected, 'id']), recomputed], ignore_index=True)
+            df = rank_projects(df.sort_values(by='cost_effectiveness', ascending=False))
+            if name == 'open':
+                df['exceeds_facility_budget'] = df['remaining_budget_by_rd'] < 0
+                df['exceeds_fund_budget'] = df['remaining_budget_by_fund'] < 0
+                df = df.reset_index(drop=True)
+            results[name] = state[name] = df
+
+        ranked = pd.concat([results['in_process'], results['open']], ignore_index=True)
+        if previous:
+            self.changes = rank_changes(pd.concat([previous['in_process'], previous['open']], ignore_index=True), ranked)
+            print(f"{self.changes['id'].nunique()} projects changed rank or budget columns.")
+        self.state = state
+        pd.to_pickle(state, self.path)
+        return results['open'], results['in_process'], completed
@@ -0,0 +1,183 @@
+import json
+import os
+import re
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+from functools import wraps
+try:
+    import resource
+except ImportError: # not available on Windows
+    resource = None
+
+# update variables as needed
+report_dir = 'run_reports' # one JSON lines report per run
+profile_modes = ['cprofile', 'tracemalloc']
+
+run = None # the Run being recorded, None when nothing is recorded
+current_stage = None
+
+
+class Run:
+    """
+    Report of one pipeline run, written as JSON lines to report_dir/<run_id>.jsonl.
+    Every Monday, SQL and S3 call is a 'call' line; every stage is a 'stage' line with its duration, peak memory and
+    a summary of the calls made during it. With profile='cprofile' each stage is also profiled to
+    report_dir/<run_id>.<stage>.prof, with profile='tracemalloc' the stage's peak Python allocation is recorded.
+    """
+    def __init__(self, profile=None, report_dir=report_dir):
+        if profile is not None and profile not in profile_modes:
+            raise ValueError(f'profile must be one of {profile_modes}')
+        self.run_id = datetime.now().strftime('%Y%m%d-%H%M%S')
+        self.profile = profile
+        self.report_dir = report_dir
+        self.path = os.path.join(report_dir, f'{self.run_id}.jsonl')
+        self.started = time.perf_counter()
+        self.stages = []
+        self.calls = []
+        self.lock = threading.Lock()
+        os.makedirs(report_dir, exist_ok=True)
+        self.file = open(self.path, 'a')
+
+    def write(self, event):
+        with self.lock:
+            self.file.write(json.dumps({'run_id': self.run_id, **event}, default=str) + '\n')
+            self.file.flush()
+
+    def add_call(self, event):
+        with self.lock:
+            self.calls.append(event)
+        self.write(event)
+
+
+def start_run(profile=None):
+    """
+    Starts recording stages and calls to a new run report.
+    """
+    global run
+    run = Run(profile)
+    print(f'Recording run report to {run.path}')
+    return run
+
+
+def operation_name(query):
+    """
+    First field of a GraphQL document, e.g. items_page or change_multiple_column_values.
+    """
+    match = re.search(r'\{\s*(?:\w+\s*:\s*)?(\w+)', query)
+    return match.group(1) if match else 'query'
+
+
+def max_rss_bytes():
+    # peak resident memory of the process so far, ru_maxrss is in kilobytes on Linux
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+@contextmanager
+def call(kind, name):
+    """
+    Records one external call of kind 'monday', 'sql' or 's3'. Yields a dictionary the caller can add
+    details to, such as bytes, retries, rows or complexity.
+    """
+    record = {'type': 'call', 'kind': kind, 'name': name, 'stage': current_stage}
+    start = time.perf_counter()
+    try:
+        yield record
+    except Exception as e:
+        record['error'] = str(e)[:200]
+        raise
+    finally:
+        record['seconds'] = round(time.perf_counter() - start, 4)
+        if run is not None:
+            run.add_call(record)
+
+
+def instrumented(kind):
+    """
+    Decorator recording every call of the function as a call of this kind.
+    """
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            with call(kind, function.__name__):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def summarize_calls(calls):
+    summary = {}
+    for event in calls:
+        kind = summary.setdefault(event['kind'], {'calls': 0, 'seconds': 0.0, 'bytes': 0, 'retries': 0, 'complexity': 0, 'errors': 0})
+        kind['calls'] += 1
+        kind['seconds'] = round(kind['seconds'] + event['seconds'], 4)
+        kind['bytes'] += event.get('bytes', 0)
+        kind['retries'] += event.get('retries', 0)
+        kind['complexity'] += event.get('complexity', 0)
+        kind['errors'] += 'error' in event
+    return summary
+
+
+@contextmanager
+def stage(name):
+    """
+    Records a pipeline stage. Calls made during it are summarized in its report line; their summed seconds can
+    exceed the stage's own when calls run concurrently.
+    """
+    global current_stage
+    if run is None:
+        yield
+        return
+
+    current_stage = name
+    first_call = len(run.calls)
+    profiler = None
+    if run.profile == 'cprofile':
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+    elif run.profile == 'tracemalloc':
+        tracemalloc.start()
+    start = time.perf_counter()
+    event = {'type': 'stage', 'name': name}
+    try:
+        yield
+    except Exception as e:
+        event['error'] = str(e)[:200]
+        raise
+    finally:
+        event['seconds'] = round(time.perf_counter() - start, 3)
+        event['max_rss_bytes'] = max_rss_bytes()
+        if profiler is not None:
+            profiler.disable()
+            event['profile'] = os.path.join(run.report_dir, f'{run.run_id}.{name}.prof')
+            profiler.dump_stats(event['profile'])
+        elif run.profile == 'tracemalloc':
+            event['peak_traced_bytes'] = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        event['calls'] = summarize_calls(run.calls[first_call:])
+        current_stage = None
+        run.stages.append(event)
+        run.write(event)
+
+        calls = ', '.join(f"{summary['calls']} {kind} calls ({summary['seconds']:.1f} s)" for kind, summary in event['calls'].items())
+        print(f"{name} took {event['seconds']:.1f} seconds." + (f' {calls}' if calls else ''))
+
+
+def finish_run():
+    """
+    Writes the run's totals and closes its report.
+    """
+    global run
+    if run is None:
+        return
+    event = {'type': 'run', 'seconds': round(time.perf_counter() - run.started, 3), 'max_rss_bytes': max_rss_bytes(),
+             'stages': {stage['name']: stage['seconds'] for stage in run.stages}, 'calls': summarize_calls(run.calls)}
+    run.write(event)
+    run.file.close()
+    print(f"Run took {round(event['seconds'] / 60, 2)} minutes total. Report: {run.path}")
+    run = None
@@ -0,0 +1,253 @@
+import asyncio
+import json
+import re
+import time
+from functools import lru_cache
+from monday_functions import get_monday, http, json_default, api_version, mutation_batch_size, MAX_RETRIES, \
+    complexity_fields
+from instrumentation import call, operation_name
+
+# update variables as needed
+max_concurrency = 8 # requests in flight at once
+min_budget = 100000 # waits for the complexity budget to reset when less than this is left
+backoff = 2 # seconds, doubled on every retry when Monday doesn't say when the budget resets
+
+
+class AsyncMonday:
+    """
+    Asyncio version of the Monday operations used by the pipeline.
+    Requests run concurrently, at most max_concurrency at a time, and every request also asks for its
+    complexity so the remaining budget and its reset time can be tracked. When the budget runs low, or Monday
+    rejects a request for going over it, requests wait for the reset instead of sleeping a fixed delay.
+    """
+    def __init__(self, monday=None, max_concurrency=max_concurrency):
+        self.monday = monday or get_monday()
+        self.max_concurrency = max_concurrency
+        self.budget = None # complexity left after the last response
+        self.reset_at = 0.0 # time.monotonic() when the budget resets
+        self._loop = None
+        self._semaphore = None
+
+    @property
+    def semaphore(self):
+        # a semaphore belongs to one event loop, so a new one is made for every asyncio.run
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    def _headers(self):
+        return {
+            'Authorization': self.monday.api_key,
+            'Content-Type': 'application/json',
+            'API-Version': api_version,
+        }
+
+    def _update_budget(self, complexity):
+        if complexity:
+            self.budget = complexity['after']
+            self.reset_at = time.monotonic() + complexity['reset_in_x_seconds']
+
+    async def _wait_for_budget(self):
+        if self.budget is not None and self.budget < min_budget:
+            delay = self.reset_at - time.monotonic()
+            if delay > 0:
+                print(f"Complexity budget low ({self.budget}). Waiting {round(delay)} seconds for reset...")
+                await asyncio.sleep(delay)
+            self.budget = None
+
+    async def execute(self, query, variables=None, allow_errors=False):
+        """
+        Sends a GraphQL document with its complexity appended, throttling on the complexity budget.
+        With allow_errors=True, GraphQL errors are returned with the partial data instead of raised.
+        """
+        # ask for the complexity alongside the document's own fields
+        name = operation_name(query)
+        query = query.rstrip()[:-1] + complexity_fields + ' }'
+        data = {'query': query, 'variables': variables or {}}
+
+        async with self.semaphore:
+            with call('monday', name) as record:
+                for attempt in range(MAX_RETRIES):
+                    record['retries'] = attempt
+                    await self._wait_for_budget()
+                    delay = backoff * 2 ** attempt
+                    try:
+                        response = await asyncio.to_thread(http().post, self.monday.url, headers=self._headers(), json=data)
+                        record['bytes'] = len(response.content)
+                        response_json = response.json()
+                        if response.status_code == 429 or response_json.get('error_code') == 'ComplexityException':
+                            # Monday says how long until the budget resets
+                            message = response_json.get('error_message', '')
+                            reset = re.search(r'reset in (\d+) seconds', message)
+                            if reset:
+                                delay = int(reset.group(1)) + 1
+                            elif 'Retry-After' in response.headers:
+                                delay = int(response.headers['Retry-After'])
+                            self.budget = 0
+                            self.reset_at = time.monotonic() + delay
+                            raise Exception(message or 'Rate limited')
+                        response.raise_for_status()
+                        if 'error_message' in response_json or ('errors' in response_json and not allow_errors):
+                            raise Exception(response_json.get('errors') or response_json.get('error_message'))
+                        complexity = (response_json.get('data') or {}).get('complexity')
+                        self._update_budget(complexity)
+                        record['complexity'] = (complexity or {}).get('query', 0)
+                        return response_json
+                    except Exception as e:
+                        if attempt < MAX_RETRIES - 1:
+                            print(f"Error occurred: {e}. Retrying in {delay} seconds...")
+                            await asyncio.sleep(delay)
+                        else:
+                            print(f"An error occurred while querying Monday after {MAX_RETRIES} attempts: {e}")
+                            raise
+
+    async def gather(self, coroutines):
+        """
+        Runs coroutines concurrently, returning results and exceptions in order.
+        """
+        return await asyncio.gather(*coroutines, return_exceptions=True)
+
+    async def create_items_batch(self, board_id, items, column_ids, batch_size=mutation_batch_size, on_batch=None):
+        """
+        Creates items with aliased create_item mutations, packing batch_size items into each request and
+        sending the batches concurrently. items is a list of dictionaries with group, name and column_values.
+        Returns, in the order of items, each new item with its id, group and the texts of column_ids, or None if
+        it wasn't created. on_batch(batch, created) is called as each request completes.
+        """
+        async def send_batch(batch):
+            declarations = ['$boardId: ID!', '$columnIds: [String!]']
+            mutations = []
+            variables = {'boardId': str(board_id), 'columnIds': column_ids}
+            for i, item in enumerate(batch):
+                declarations.append(f'$group{i}: String, $name{i}: String!, $values{i}: JSON')
+                mutations.append(f'item{i}: create_item(board_id: $boardId, group_id: $group{i}, item_name: $name{i}, '
+                                 f'column_values: $values{i}, create_labels_if_missing: true) '
+                                 '{ id name group { title } column_values(ids: $columnIds) { id text } }')
+                variables[f'group{i}'] = item['group']
+                variables[f'name{i}'] = item['name']
+                variables[f'values{i}'] = json.dumps(item['column_values'], default=json_default)
+            query = 'mutation (%s) { %s }' % (', '.join(declarations), ' '.join(mutations))
+
+            try:
+                response_json = await self.execute(query, variables, allow_errors=True)
+                data = response_json.get('data') or {}
+                for error in response_json.get('errors', []):
+                    print(f"Error creating items: {error.get('message', error)}")
+            except Exception as e:
+                print(f"Error creating items: {e}")
+                data = {}
+            created = [data.get(f'item{i}') for i in range(len(batch))]
+            if on_batch is not None:
+                on_batch(batch, created)
+            return created
+
+        batches = [items[start:start + batch_size] for start in range(0, len(items), batch_size)]
+        results = await asyncio.gather(*[send_batch(batch) for batch in batches])
+        return [item for batch in results for item in batch]
+
+    async def move_item_to_group(self, item_id, group_id):
+        query = """
+            mutation ($itemId: ID, $groupId: String!) {
+                move_item_to_group (item_id: $itemId, group_id: $groupId) {
+                    id
+                    group {
+                        title
+                    }
+                }
+            }
+        """
+        response_json = await self.execute(query, {'itemId': str(item_id), 'groupId': group_id})
+        return response_json['data']['move_item_to_group']
+
+    async def delete_item(self, item_id):
+        query = """
+            mutation ($itemId: ID) {
+                delete_item (item_id: $itemId) {
+                    id
+                }
+            }
+        """
+        await self.execute(query, {'itemId': str(item_id)})
+
+    async def change_multiple_values_batch(self, board_id, updates, batch_size=mutation_batch_size, on_batch=None):
+        """
+        Writes several columns of several items with aliased change_multiple_column_values mutations,
+        packing batch_size items into each request and sending the batches concurrently.
+        updates is a dictionary of item id -> {column id: value}.
+        Returns a dictionary of item id -> True if the item was updated, False otherwise.
+        on_batch(status) is called with each request's part of that dictionary as the request completes.
+        """
+        item_ids = list(updates)
+
+        async def send_batch(batch):
+            declarations = ['$boardId: ID!']
+            mutations = []
+            variables = {'boardId': str(board_id)}
+            for i, item_id in enumerate(batch):
+                declarations.append(f'$item{i}: ID!, $values{i}: JSON!')
+                mutations.append(f'item{i}: change_multiple_column_values(board_id: $boardId, item_id: $item{i}, column_values: $values{i}) {{ id }}')
+                variables[f'item{i}'] = str(item_id)
+                variables[f'values{i}'] = json.dumps(updates[item_id], default=json_default)
+            query = 'mutation (%s) { %s }' % (', '.join(declarations), ' '.join(mutations))
+
+            try:
+                response_json = await self.execute(query, variables, allow_errors=True)
+                data = response_json.get('data') or {}
+                for error in response_json.get('errors', []):
+                    print(f"Error updating items: {error.get('message', error)}")
+            except Exception as e:
+                print(f"Error updating items: {e}")
+                data = {}
+            status = {item_id: data.get(f'item{i}') is not None for i, item_id in enumerate(batch)}
+            if on_batch is not None:
+                on_batch(status)
+            return status
+
+        batches = [item_ids[start:start + batch_size] for start in range(0, len(item_ids), batch_size)]
+        status = {}
+        for batch_status in await asyncio.gather(*[send_batch(batch) for batch in batches]):
+            status.update(batch_status)
+        return status
+
+    async def query_subitems_batch(self, item_ids):
+        """
+        Fetches the subitems of several parent items in one request.
+        Returns a dictionary of parent item id -> list of subitems.
+        """
+        query = """
+            query ($itemIds: [ID!], $limit: Int) {
+                items (ids: $itemIds, limit: $limit) {
+                    id
+                    subitems {
+                        id
+                        name
+                        column_values(ids: ["link", "status_1"]) {
+                            id
+                            text
+                        }
+                    }
+                }
+            }
+        """
+        variables = {'itemIds': [str(item_id) for item_id in item_ids], 'limit': len(item_ids)}
+        response_json = await self.execute(query, variables)
+        items = response_json.get('data', {}).get('items', [])
+        return {item['id']: item.get('subitems') or [] for item in items}
+
+
+@lru_cache(maxsize=None)
+def get_monday_async():
+    """
+    Async Monday client shared by the whole process, created on first use.
+    """
+    return AsyncMonday()
+
+
+def run_concurrently(client, coroutines):
+    """
+    Runs coroutines on client's bounded pool from synchronous code.
+    Returns results and exceptions in the order of coroutines.
+    """
+    return asyncio.run(client.gather(coroutines))
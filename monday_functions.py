@@ -1,71 +1,325 @@
-from monday import MondayClient
 import pandas as pd
-from dotenv import load_dotenv
-import os
-import requests 
+from functools import lru_cache
+from config import getenv
+from instrumentation import call, operation_name
 import numpy as np
-from typing import List, Dict
-from collections import Counter
+from typing import Dict
 # import json 
 import time
+import json
+import queue
+import threading
+
+# columns of the project board kept by transform_dataframe (besides region, id, item_name and facility)
+project_columns = ['RD', 'Task Type', 'Project Type', 'Sub Project Type', 'Quantity', 'Priority', 'Status', 'PC', 'RL Link',
+                   'Open', 'Scheduled', 'Estimated Cost', 'Quoted Cost', 'Deposit Date', 'Deposit Amount', 'Final Cost']
+# low-cardinality project board columns, held as categoricals
+categorical_columns = ['region', 'Status', 'Priority', 'Task Type', 'RD']
+api_version = '2023-10' # needed for items_page cursor pagination
+page_limit = 500 # max items per page allowed by items_page
+subitem_batch_size = 50 # parent items per subitem query, items(ids:) returns at most 100
+mutation_batch_size = 25 # items per aliased mutation, keeps each request well under Monday's complexity limit
+prefetch_pages = 1 # pages fetched ahead in the background while the current one is parsed
+MAX_RETRIES = 3  # maximum number of retries
+DELAY = 10  # delay between retries in seconds
+
+complexity_fields = 'complexity { query before after reset_in_x_seconds }' # added to queries to record their cost
+# fields read for every item of an items_page, with only the columns in $columnIds
+item_fields = """
+    id
+    name
+    group {
+        title
+    }
+    column_values(ids: $columnIds) {
+        id
+        text
+    }
+"""
+next_page_query = """
+    query ($cursor: String!, $columnIds: [String!], $limit: Int!) {
+        next_items_page (cursor: $cursor, limit: $limit) {
+            cursor
+            items { %s }
+        }
+    }
+""" % item_fields
+
+def prefetch(iterable, depth=prefetch_pages):
+    """
+    Iterates over iterable in a background thread, keeping up to depth values ready, so the next page is
+    fetched while the caller works on the current one. Errors are raised in the caller.
+    """
+    finished = object()
+    ready = queue.Queue(maxsize=depth)
+    stopped = threading.Event()
+
+    def put(value):
+        # gives up once the caller has stopped iterating
+        while not stopped.is_set():
+            try:
+                ready.put(value, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for value in iterable:
+                if not put((value, None)):
+                    return
+            put((finished, None))
+        except Exception as e:
+            put((finished, e))
+
+    threading.Thread(target=produce, daemon=True).start()
+    try:
+        while True:
+            value, error = ready.get()
+            if value is finished:
+                if error is not None:
+                    raise error
+                return
+            yield value
+    finally:
+        stopped.set()
+
+def json_default(value):
+    """
+    Makes numpy scalars json serializable.
+    """
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def recorded(execute):
+    """
+    Wraps the monday library's GraphQLClient.execute so its requests show up in the run report.
+    """
+    def wrapper(query, variables=None):
+        with call('monday', operation_name(query)):
+            return execute(query, variables)
+    return wrapper
+
+@lru_cache(maxsize=None)
+def http():
+    """
+    The requests module, imported on first use so scripts that never call the API don't load it.
+    """
+    import requests
+    return requests
+
+@lru_cache(maxsize=None)
+def get_monday():
+    """
+    Monday client shared by the whole process, created on first use.
+    """
+    return Monday()
 
 class Monday:
     def __init__(self):
-        load_dotenv()
-        self.api_key = os.getenv('api_key')
-        self.board_id = os.getenv('board_id') 
-        self.new_board_id = os.getenv('new_board_id')
+        from monday import MondayClient
+        self.api_key = getenv('api_key')
+        self.board_id = getenv('board_id') 
+        self.new_board_id = getenv('new_board_id')
         self.client = MondayClient(self.api_key)
         self.headers = {"Authorization" : self.api_key}
-        self.url = "https://api.monday.com/v2"
+        self.url = getenv('monday_api_url') or "https://api.monday.com/v2"
+        # points the monday library at the same endpoint, e.g. a local stand-in for benchmarks
+        for resource in vars(self.client).values():
+            resource.client.endpoint = self.url
+            resource.client.execute = recorded(resource.client.execute)
 
-    def fetch_items(self, group_titles, all_groups=['North', 'South', 'Central', 'Complete']):
-        # Calculate the total number of items
-        total_items = self.count_items_in_groups(all_groups)
-        if total_items <=1000:
-            limit = total_items
-        else:
-            limit = 1000
-        # Determine the number of pages needed
-        pages = (total_items // limit) + 1
+    def fetch_project_board(self, group_titles=['North', 'South', 'Central', 'Complete']):
+        """
+        Reads the requested groups of the project board in a single pass.
+        Only the groups in group_titles and the columns kept by transform_dataframe are requested,
+        and each group is paged through with items_page cursors.
+        """
+        # pages are parsed as they arrive, without keeping a dictionary per item
+        return self.project_board_df(row for rows in self.project_row_pages(group_titles) for row in rows)
 
-        # Fetch column names
+    def project_row_pages(self, group_titles):
+        """
+        Yields the parsed rows of the requested groups of the project board one page at a time, as they arrive.
+        The next page is fetched while the current one is parsed and used.
+        """
+        column_names, column_ids = self.project_column_ids()
+        pages = self.fetch_group_pages(self.board_id, self.project_group_ids(group_titles), column_ids)
+        for page in prefetch(pages):
+            yield [self.parse_item(item, column_names) for item in page]
+
+    def project_group_ids(self, group_titles):
+        groups = self.client.groups.get_groups_by_board(self.board_id)
+        return [group['id'] for group in groups['data']['boards'][0]['groups'] if group['title'] in group_titles]
+
+    def project_column_ids(self):
+        """
+        Column names of the project board and the ids of the columns kept by transform_dataframe.
+        """
         column_names = self.fetch_column_names(self.board_id)
-        MAX_RETRIES = 3  # maximum number of retries
-        DELAY = 10  # delay between retries in seconds
-        
-        rows = []
+        column_ids = [column_id for column_id, title in column_names.items() if title in project_columns]
+        return column_names, column_ids
+
+    def project_board_df(self, rows):
+        """
+        Builds the project board DataFrame from parsed rows, any iterable of parse_item dictionaries.
+        Each row's values go straight into one buffer per kept column, so the rows don't have to be held at once.
+        """
+        columns = ['region', 'id', 'item_name', 'facility'] + project_columns
+        buffers = {column: [] for column in columns}
+        for row in rows:
+            for column in columns:
+                buffers[column].append(row.get(column))
+        df = pd.DataFrame({column: pd.Series(buffers.pop(column), dtype=object) for column in columns})
+        return self.transform_dataframe(df)
+
+    def fetch_items_by_ids(self, item_ids, column_ids, batch_size=100):
+        """
+        Fetches items by id with only the given columns, batch_size items per request.
+        Deleted items are left out, archived items come back with state 'archived'.
+        """
+        query = """
+            query ($itemIds: [ID!], $columnIds: [String!], $limit: Int) {
+                items (ids: $itemIds, limit: $limit) {
+                    id
+                    name
+                    state
+                    group {
+                        title
+                    }
+                    column_values(ids: $columnIds) {
+                        id
+                        text
+                    }
+                }
+            }
+        """
+        item_ids = list(item_ids)
+        items = []
+        for start in range(0, len(item_ids), batch_size):
+            batch = [str(item_id) for item_id in item_ids[start:start + batch_size]]
+            variables = {'itemIds': batch, 'columnIds': column_ids, 'limit': len(batch)}
+            items.extend(self.post_query(query, variables)['data']['items'])
+        return items
+
+    def fetch_changed_item_ids(self, board_id, since, limit=1000):
+        """
+        Ids of the items touched on a board since the given time, read from the board's activity log.
+        """
+        query = """
+            query ($boardId: [ID!], $from: ISO8601DateTime, $limit: Int, $page: Int) {
+                boards (ids: $boardId) {
+                    activity_logs (from: $from, limit: $limit, page: $page) {
+                        event
+                        data
+                    }
+                }
+            }
+        """
+        item_ids = set()
+        page = 1
+        while True:
+            variables = {'boardId': [str(board_id)], 'from': since, 'limit': limit, 'page': page}
+            logs = self.post_query(query, variables)['data']['boards'][0]['activity_logs']
+            for log in logs:
+                data = json.loads(log['data']) if log.get('data') else {}
+                if data.get('pulse_id'):
+                    item_ids.add(str(data['pulse_id']))
+            if len(logs) < limit:
+                return item_ids
+            page += 1
+
+    def fetch_group_pages(self, board_id, group_ids, column_ids, limit=page_limit):
+        """
+        Yields each page's list of items of the given groups, following the items_page cursor of each group
+        until it runs out.
+        """
+        query = """
+            query ($boardId: [ID!], $groupIds: [String], $columnIds: [String!], $limit: Int!) {
+                boards (ids: $boardId) {
+                    groups (ids: $groupIds) {
+                        items_page (limit: $limit) {
+                            cursor
+                            items { %s }
+                        }
+                    }
+                }
+            }
+        """ % item_fields
+
+        if not group_ids:
+            return
 
-        # Fetch and process items page by page
-        for page in range(1, pages + 1):
+        variables = {'boardId': [str(board_id)], 'groupIds': group_ids, 'columnIds': column_ids, 'limit': limit}
+        results = self.post_query(query, variables)
+        for group in results['data']['boards'][0]['groups']:
+            yield from self.follow_items_pages(group['items_page'], column_ids, limit)
+
+    def fetch_board_items(self, board_id, column_ids, limit=page_limit):
+        """
+        Yields every item of a board with only the given columns, limit items per items_page request.
+        """
+        query = """
+            query ($boardId: [ID!], $columnIds: [String!], $limit: Int!) {
+                boards (ids: $boardId) {
+                    items_page (limit: $limit) {
+                        cursor
+                        items { %s }
+                    }
+                }
+            }
+        """ % item_fields
+        variables = {'boardId': [str(board_id)], 'columnIds': column_ids, 'limit': limit}
+        results = self.post_query(query, variables)
+        for page in self.follow_items_pages(results['data']['boards'][0]['items_page'], column_ids, limit):
+            yield from page
+
+    def follow_items_pages(self, page, column_ids, limit=page_limit):
+        """
+        Yields the list of items of an items_page and of each page after it, following its cursor until it runs out.
+        """
+        yield page['items']
+        cursor = page['cursor']
+        while cursor:
+            variables = {'cursor': cursor, 'columnIds': column_ids, 'limit': limit}
+            page = self.post_query(next_page_query, variables)['data']['next_items_page']
+            yield page['items']
+            cursor = page['cursor']
+
+    def post_query(self, query, variables=None, allow_errors=False):
+        """
+        Sends a GraphQL query to the Monday API, retrying on errors.
+        With allow_errors=True, GraphQL errors are returned with the partial data instead of raised.
+        """
+        headers = {
+            'Authorization': self.api_key,
+            'Content-Type': 'application/json',
+            'API-Version': api_version,
+        }
+        # ask for the complexity alongside the document's own fields so its cost is recorded
+        data = {'query': query.rstrip()[:-1] + complexity_fields + ' }', 'variables': variables or {}}
+
+        with call('monday', operation_name(query)) as record:
             for attempt in range(MAX_RETRIES):
+                record['retries'] = attempt
                 try:
-                    results = self.client.boards.fetch_items_by_board_id(board_ids=self.board_id, limit=limit, page=page)
-                    data = results['data']['boards'][0]['items']
-                    break
+                    response = http().post(self.url, headers=headers, json=data)
+                    record['bytes'] = len(response.content)
+                    response.raise_for_status()
+                    response_json = response.json()
+                    if 'error_message' in response_json or ('errors' in response_json and not allow_errors):
+                        raise Exception(response_json.get('errors') or response_json.get('error_message'))
+                    record['complexity'] = ((response_json.get('data') or {}).get('complexity') or {}).get('query', 0)
+                    return response_json
                 except Exception as e:
                     if attempt < MAX_RETRIES - 1:  # i.e., if it's not the last attempt
                         print(f"Error occurred: {e}. Retrying in {DELAY} seconds...")
                         time.sleep(DELAY)  # wait for the specified delay
                     else:
-                        print(f"An error occurred while fetching items after {MAX_RETRIES} attempts: {e}")
-                        return pd.DataFrame()  # or handle the error as appropriate
-
-
-            for item in data:
-                if item['group']['title'] in set(group_titles):
-                    row = self.parse_item(item, column_names)
-                    rows.append(row)
-            
-        df = pd.DataFrame(rows)
-
-        df = self.transform_dataframe(df)  # Moved dataframe manipulation to a separate function
-
-        return df
-    
-    def fetch_items_by_board_id(self, board):
-        items = self.client.boards.fetch_items_by_board_id(board)
-        return items
+                        print(f"An error occurred while querying Monday after {MAX_RETRIES} attempts: {e}")
+                        raise
 
     def fetch_column_names(self, board_id):
         results = self.client.boards.fetch_columns_by_board_id(board_ids=board_id)
@@ -73,23 +327,6 @@ class Monday:
         column_names = {column['id']: column['title'] for column in data}
         return column_names
 
-    def count_items_in_groups(self, group_titles: List[str]) -> int:
-        # Fetch all groups on the board
-        groups = self.client.groups.get_groups_by_board(self.board_id)
-        
-        # Filter out the groups with matching titles
-        relevant_groups = [group for group in groups['data']['boards'][0]['groups'] 
-                        if group['title'] in group_titles]
-
-        # For each relevant group, fetch items and count them
-        total_items = 0
-        for group in relevant_groups:
-            group_id = group['id']
-            group_items = self.client.groups.get_items_by_group(self.board_id, group_id)
-            total_items += len(group_items['data']['boards'][0]['groups'][0]['items'])
-
-        return total_items
-
     def parse_item(self, item: Dict, column_names: Dict[str, str]) -> Dict:
         """
         Helper function to parse an item into a dictionary.
@@ -116,14 +353,14 @@ class Monday:
         df = df[['region','id', 'RD', 'Task Type', 'Project Type', 'Sub Project Type', 'Quantity','item_name', 'Priority', 'Status', 'PC', 'RL Link', 'Open', 'Scheduled', 'Estimated Cost', 'Quoted Cost', 'Deposit Date','Deposit Amount','Final Cost']]
         df.loc[:, 'Open'] = pd.to_datetime(df['Open']).dt.date
         df.loc[:, 'RD'] = df['RD'].str.strip()
+        df = df.astype({column: 'category' for column in categorical_columns})
 
         return df
 
-    def delete_item(self, item_id):
-        self.client.items.delete_item_by_id(item_id)  
-
-    def create_items_from_df(self, row, group_id, error_group, ineligible_group):
-
+    def item_group(self, row, group_id, error_group, ineligible_group):
+        """
+        Group a new Ranking board item goes to.
+        """
         if group_id =='new_group51572' or group_id=='topics': #if completed or in process, no errors
             group = group_id
         # checks if cost is blank or 0 or if cost_effectiveness is blank or if status is Escalation
@@ -134,8 +371,14 @@ class Monday:
             group = ineligible_group
         else: #else goes to eligible
             group = group_id
+        return group
+
+    def item_column_values(self, row):
+        """
+        Column values of a new Ranking board item.
+        """
         # Construct the column_values (you can customize this based on your needs)
-        column_values = row.to_dict()
+        column_values = dict(row)
         
         for key, value in column_values.items():
             if pd.isna(value):
@@ -152,53 +395,7 @@ class Monday:
                     column_values[dropdown] = "2"
                 else:
                     column_values[dropdown] = "3"
-
-        # print(column_values)
-        # Create the item
-        try:
-            print("trying to create item...")
-
-            response = self.client.items.create_item(board_id=self.new_board_id, group_id=group, 
-                                                        item_name=row['name'], 
-                                                        column_values=column_values,
-                                                        create_labels_if_missing=True)
-            print(f'API Response: {response}')
-        except Exception as e:
-            print(f"Error creating item: {e}") 
-
-    def move_items_between_groups(self, item_id, group):
-        self.client.items.move_item_to_group(item_id, group)
-
-    def change_item_value(self, new_board_id, item_id, column_id, value):
-        self.client.items.change_item_value(new_board_id, item_id, column_id, value)
- 
-    def find_existing_ids(self, new_board_id):
-        existing_items = self.client.boards.fetch_items_by_board_id(new_board_id)
-        existing_items = existing_items['data']['boards'][0]['items']
-        return [next((col["text"] for col in item["column_values"] if col["id"] == "text2"), None) for item in existing_items]
-
-    def find_duplicate_ids(self, id_list):
-        counts = Counter(id_list)
-        return [id for id, count in counts.items() if count > 1]
-
-    def delete_duplicates(self, duplicate_ids, new_board_id):
-        existing_items = self.client.boards.fetch_items_by_board_id(new_board_id)
-        existing_items = existing_items['data']['boards'][0]['items']
-
-        for item in existing_items:
-            id = next((col["text"] for col in item["column_values"] if col["id"] == "text2"), None)
-            item_id = item['id']
-
-            if id in duplicate_ids:
-                # remove this id from duplicate_ids list so we keep one of them
-                duplicate_ids.remove(id)
-
-                # delete this item
-                try:
-                    self.delete_item(item_id)
-                    print(f"Deleted item: {item_id}")
-                except Exception as e:
-                    print(f"Error deleting item: {e}")
+        return column_values
 
     def query_items(self, board_id):
         headers = {
@@ -229,40 +426,13 @@ class Monday:
 
         data = {'query': query, 'variables': variables}
 
-        response = requests.post('https://api.monday.com/v2', headers=headers, json=data)
+        with call('monday', operation_name(query)) as record:
+            response = http().post(self.url, headers=headers, json=data)
+            record['bytes'] = len(response.content)
         response_json = response.json()
         return response_json
 
-    def query_subitems(self, item_id):
-        headers = {
-            'Authorization': self.api_key,
-            'Content-Type': 'application/json',
-        }
-
-        query = """
-            query ($itemId: [Int]) {
-                items (ids: $itemId) {
-                    subitems {
-                        id
-                        name
-                        column_values(ids: ["link", "status_1"]) {
-                            id
-                            text
-                        }
-                    }
-                }
-            }
-        """
-
-        variables = {'itemId': [int(item_id)]}  
-
-        data = {'query': query, 'variables': variables}
-
-        response = requests.post('https://api.monday.com/v2', headers=headers, json=data)
-        response_json = response.json()
-        return response_json
-    
-    def generate_subitem_df(self, board_id, groups=['South', 'North', 'Central']):
+    def generate_subitem_df(self, board_id, groups=['South', 'North', 'Central'], batch_size=subitem_batch_size):
         data_for_df = []
 
         items_results = self.query_items(board_id)
@@ -274,35 +444,38 @@ class Monday:
         items_data = [item for item in items_data if item['group']['title'] in groups and any(col.get('value') == '{"ids":[1]}' for col in item['column_values'] if col.get('id') == 'dropdown3')]
         assert items_data, "No items match the given conditions"
 
+        # fetch subitems for many parent items per request instead of one request per parent, the requests concurrently
+        from monday_async import get_monday_async, run_concurrently
+        monday_async = get_monday_async()
+        batches = [[item['id'] for item in items_data[start:start + batch_size]] for start in range(0, len(items_data), batch_size)]
+        subitems_by_item = {}
+        for result in run_concurrently(monday_async, [monday_async.query_subitems_batch(batch_ids) for batch_ids in batches]):
+            if isinstance(result, Exception):
+                raise result
+            subitems_by_item.update(result)
+
         for item in items_data:
             item_id = item['id']
             item_name = item['name']
             rd = next((col.get('text') for col in item['column_values'] if col.get('id') == 'text4'), None)
             item_status = next((col.get('text') for col in item['column_values'] if col.get('id') == 'status'), None)
 
-            subitems_results = self.query_subitems(item_id)
-            assert subitems_results is not None, "subitems_results is None"
-
-            items = subitems_results.get('data', {}).get('items', [])
-            if items:
-                subitems = items[0].get('subitems', [])
-                if subitems:
-                    for subitem in subitems:
-                        subitem_id = subitem['id']
-                        subitem_name = subitem['name']
-                        subitem_link = next((col.get('text') for col in subitem['column_values'] if col.get('id') == 'link'), None)
-                        subitem_status_1 = next((col.get('text') for col in subitem['column_values'] if col.get('id') == 'status_1'), None) or item_status
-
-                        if not (subitem_name == 'Subitem' and not subitem_link):
-                            data_for_df.append({
-                                "item_id": item_id,
-                                "subitem_id": subitem_id,
-                                "site_code": rd,
-                                "item_name": item_name,
-                                "subitem_name": subitem_name,
-                                "link": subitem_link,
-                                "status_1": subitem_status_1
-                            })
+            for subitem in subitems_by_item.get(item_id, []):
+                subitem_id = subitem['id']
+                subitem_name = subitem['name']
+                subitem_link = next((col.get('text') for col in subitem['column_values'] if col.get('id') == 'link'), None)
+                subitem_status_1 = next((col.get('text') for col in subitem['column_values'] if col.get('id') == 'status_1'), None) or item_status
+
+                if not (subitem_name == 'Subitem' and not subitem_link):
+                    data_for_df.append({
+                        "item_id": item_id,
+                        "subitem_id": subitem_id,
+                        "site_code": rd,
+                        "item_name": item_name,
+                        "subitem_name": subitem_name,
+                        "link": subitem_link,
+                        "status_1": subitem_status_1
+                    })
 
         df = pd.DataFrame(data_for_df)
         assert not df.empty, "DataFrame is empty"
@@ -1,22 +1,34 @@
 import pandas as pd
-from monday_functions import Monday
-from sql_queries import run_sql_query, facilities_sql 
+import numpy as np
+from monday_functions import get_monday
+from monday_async import get_monday_async, run_concurrently
+from board_mirror import BoardMirror
+from reference_data import get_facilities
 from helpers import remaining_facility, remaining_fund, categorize_projects
 from algo import calculate_costs, calc_cost_effectiveness
-import os
-import json
-from dotenv import load_dotenv
+from budget_selection import optimal_budget_columns
+import asyncio
+from config import getenv
 
-load_dotenv()
 # update variables as needed - scaling variables in algo.py
 buffer = 1.1 # adding a 10% buffer to costs of uncompleted projects
 capex_threshold = 2500
+# 'greedy' funds pending projects in cost_effectiveness order, 'optimal' picks the set with the most priority value
+#   that fits the facility and fund budgets (see budget_selection.py)
+selection_method = 'greedy'
+# re-ranks only the projects that changed since the last run, from the state saved by incremental_ranking.py
+incremental_ranking = False
+# reads the project board from the local mirror, fetching only what changed since the last run. Off until a full
+#   sync has been checked against a live fetch: the delta sync follows the activity log, which misses formula and
+#   mirror column changes
+use_board_mirror = False
 pending_statuses = ['Waiting for Estimate', 'Vendor Needed','Quote Requested','New Project', 'On Hold','Gathering Scope', 'Locating Vendors']
 # checks the values and updates changes for these columns
 columns_to_check = ['numbers', 'numbers6', 'status19', 'status9', 'numbers05', 'numbers_15', 'numbers1']
-monday_data = Monday()
-new_board_id = os.getenv('new_board_id')
-board_id = os.getenv('board_id')
+# Ranking board columns read into the board snapshot, besides the project id in text2, and their dtypes
+snapshot_columns = {'status19': 'string', 'numbers': 'Float64', 'numbers6': 'Float64', 'numbers0': 'Int64', 'numbers_1': 'Int64',
+                    'status9': 'string', 'numbers1': 'Float64', 'numbers05': 'Int64', 'numbers_15': 'Int64', 'text': 'string',
+                    'text8': 'string', 'rd': 'string'}
 
 # group ids
 in_process_group = 'topics'
@@ -52,12 +64,17 @@ status_mapping = {
     '':{'text':'', 'value': {"index":5}}
 }
 
-facilities = run_sql_query(facilities_sql)
-
 def fetch_data():
     print("Fetching project board...takes up to 3 mins.")
-    completed = monday_data.fetch_items(['Complete'])
-    open_data = monday_data.fetch_items(['North', 'South', 'Central'], all_groups=['North', 'South', 'Central'])
+    # reads the board once and splits Complete from the regional groups locally
+    if use_board_mirror:
+        mirror = BoardMirror(get_monday())
+        mirror.sync(['North', 'South', 'Central', 'Complete'])
+        project_board = mirror.load(['North', 'South', 'Central', 'Complete'])
+    else:
+        project_board = get_monday().fetch_project_board(['North', 'South', 'Central', 'Complete'])
+    completed = project_board[project_board['region'] == 'Complete'].reset_index(drop=True)
+    open_data = project_board[project_board['region'] != 'Complete'].reset_index(drop=True)
     
     # Filter rows with 'status' == 'Compete' from open_data
     to_move = open_data[open_data['Status'] == 'Compete']
@@ -87,7 +104,12 @@ def calculate_combined_costs(df_in_process, completed_df, buffer): #buffer deter
     return pd.concat([completed_df, df_in_process], ignore_index=True)
 
 def gathered_budgets(completed_combined, facilities):
-    remaining_facility_df = remaining_facility(completed_combined, facilities)
+    return fund_budgets(remaining_facility(completed_combined, facilities))
+
+def fund_budgets(remaining_facility_df):
+    """
+    Adds each facility's fund budget to the facility budgets from remaining_facility.
+    """
     remaining_fund_df = remaining_fund(remaining_facility_df)
     facilities_df = remaining_facility_df.merge(remaining_fund_df, on=['fund','Capex'], how='left')
     print('fetched budgets')
@@ -99,10 +121,18 @@ def gathered_budgets(completed_combined, facilities):
 
 def process_dataframes(df, facilities_df):
     df = calc_cost_effectiveness(df)
+    df = merge_budgets(df, facilities_df)
+    print('processed cost effectiveness')
+    return df
+
+def merge_budgets(df, facilities_df):
+    """
+    Adds the remaining facility and fund budgets of each project's Capex or R&M budget, highest cost
+    effectiveness first.
+    """
     df['Capex'] = df['cost'] > capex_threshold
     df = df.merge(facilities_df[['RD','Capex', 'fund', 'remaining_budget', 'remaining_fund_budget']], on=['RD','Capex'], how='left')
     df = df.sort_values(by='cost_effectiveness', ascending=False)
-    print('processed cost effectiveness')
     return df
 
 def add_cumulative_budget_columns(df):
@@ -117,10 +147,23 @@ def add_cumulative_budget_columns(df):
         'remaining_fund_budget': 'current_fund_budget_status'
     })
 
+def select_projects(df):
+    """
+    Budget columns of the pending projects, using selection_method.
+    """
+    if selection_method == 'optimal':
+        return optimal_budget_columns(df)
+    if selection_method != 'greedy':
+        raise ValueError(f"selection_method must be 'greedy' or 'optimal', not {selection_method!r}")
+    return add_cumulative_budget_columns(df)
+
 def calc_and_sort():
     completed_df, open_df = fetch_data()
     assert not completed_df.empty, "The completed_df dataframe is empty."
     assert not open_df.empty, "The open_df dataframe is empty."
+    if incremental_ranking:
+        from incremental_ranking import RankingState
+        return RankingState().update(completed_df, open_df)
     
     open_df = categorize_projects(open_df, pending_statuses)
     
@@ -132,8 +175,8 @@ def calc_and_sort():
     completed_combined = calculate_combined_costs(df_in_process, completed_df, buffer)
     assert len(completed_combined) == len(df_in_process) + len(completed_df), "Data mismatch in combined dataframe."
     
-    completed_budgets = gathered_budgets(completed_df, facilities)
-    expected_budgets = gathered_budgets(completed_combined, facilities) 
+    completed_budgets = gathered_budgets(completed_df, get_facilities())
+    expected_budgets = gathered_budgets(completed_combined, get_facilities())
     expected_columns = ['RD', 'fund', 'Capex', 'facility_budget', 'spent_facility','remaining_budget', 'fund_budget', 'spent_fund','remaining_fund_budget']
     assert all(column in expected_budgets.columns for column in expected_columns), "expected_budget is missing expected columns."
     
@@ -141,7 +184,7 @@ def calc_and_sort():
     open_df = process_dataframes(df_pending, expected_budgets)
 
     df_in_process = add_cumulative_budget_columns(df_in_process)
-    open_df = add_cumulative_budget_columns(open_df)
+    open_df = select_projects(open_df)
     budget_columns = ['cumulative_cost', 'cumulative_fund_cost', 'remaining_budget_by_rd', 'remaining_budget_by_fund']
     assert all(column in open_df.columns for column in budget_columns), "open_df is missing budget columns after calculations."
 
@@ -152,6 +195,8 @@ def calc_and_sort():
     return open_df, df_in_process, completed_df
 
 def preprocess_df(df): #column_mappings at the top
+    # categorical columns of the project board are written as plain values
+    df = df.astype({column: object for column in df.columns if isinstance(df[column].dtype, pd.CategoricalDtype)})
     for original_column, (new_column, default_value) in column_mappings.items():
         # If the column exists, rename it
         if original_column in df.columns:
@@ -173,9 +218,10 @@ def preprocess_df(df): #column_mappings at the top
     df['text2'] = df['text2'].astype(str)
     # df['status9'] = df['status9'].map(status_mapping)
     df['status9'] = df['status9'].map(lambda x: {"text": x, "value": status_mapping.get(x, {})})
+    board_id = getenv('board_id')
     df['link'] = df.apply(lambda row: {"url": f"https://reddotstorage2.monday.com/boards/{board_id}/pulses/{row['text2']}", "text": row['name']}, axis=1)
 
-    existing_column_names = monday_data.fetch_column_names(new_board_id)
+    existing_column_names = get_monday().fetch_column_names(getenv('new_board_id'))
 
     # Find the columns to drop
     columns_to_drop = set(df.columns) - set(existing_column_names)
@@ -193,148 +239,256 @@ def preprocessing(df_in_process, open_df, completed):
 
 def find_existing_rows():
     print('fetching data from Ranking board...')
-    existing_items = monday_data.fetch_items_by_board_id(new_board_id)
-    existing_items = existing_items['data']['boards'][0]['items']
-    output = [
-        {
-            "id": next((col["text"] for col in item["column_values"] if col["id"] == "text2"), None), #id
-            "group": item['group']['title'], #name
-            "status19": next((col["text"] for col in item["column_values"] if col["id"] == "status19"), None), #status
-            "item_id": item['id'], #new id
-            "numbers": next((col["text"] for col in item["column_values"] if col["id"] == "numbers"), None), #cost
-            "numbers6": next((col["text"] for col in item["column_values"] if col["id"] == "numbers6"), None), #ranking
-            "numbers0": next((col["text"] for col in item["column_values"] if col["id"] == "numbers0"), None),#rd budget
-            "numbers_1": next((col["text"] for col in item["column_values"] if col["id"] == "numbers_1"), None),#fund budget
-            "status9": next((col["text"] for col in item["column_values"] if col["id"] == "status9"), None), #priority
-            "numbers1": next((col["text"] for col in item["column_values"] if col["id"] == "numbers1"), None), #priority value
-            "numbers05": next((col["text"] for col in item["column_values"] if col["id"] == "numbers05"), None),#after rd budget
-            "numbers_15": next((col["text"] for col in item["column_values"] if col["id"] == "numbers_15"), None),#after fund budget
-            "text": next((col["text"] for col in item["column_values"] if col["id"] == "text"), None), #fund
-            "text8": next((col["text"] for col in item["column_values"] if col["id"] == "text8"), None), #pc
-            "rd": next((col["text"] for col in item["column_values"] if col["id"] == "rd"), None) #pc
-        } 
-        for item in existing_items
-        ]
-
-    df = pd.DataFrame(output)
-
-    # Replace blank strings with 0
-    df.replace('', 0, inplace=True)
-    
-    # Convert to the correct data types
-    df['numbers'] = df['numbers'].astype(float)
-    df['numbers6'] = df['numbers6'].astype(float)
-    df['numbers0'] = df['numbers0'].astype(int)
-    df['numbers_1'] = df['numbers_1'].astype(int)
-    df['numbers1'] = df['numbers1'].astype(float)
-    df['numbers05'] = df['numbers05'].astype(int)
-    df['numbers_15'] = df['numbers_15'].astype(int)
-    
+    items = get_monday().fetch_board_items(getenv('new_board_id'), ['text2'] + list(snapshot_columns))
+    return existing_rows(items)
+
+def existing_rows(items):
+    """
+    Ranking board snapshot of Monday items: the project id (text2), group title, item id and snapshot_columns.
+    Column values are decoded in one pass over the items into a buffer per column, then typed a column at a time.
+    Blank cells are missing values (pd.NA), not 0.
+    """
+    buffers = {column: [] for column in ['id', 'group', 'item_id'] + list(snapshot_columns)}
+    for item in items:
+        values = {column['id']: column['text'] for column in item['column_values']}
+        buffers['id'].append(values.get('text2'))
+        buffers['group'].append(item['group']['title'])
+        buffers['item_id'].append(item['id'])
+        for column in snapshot_columns:
+            buffers[column].append(values.get(column))
+
+    df = pd.DataFrame({column: buffers.pop(column) for column in ['id', 'group', 'item_id']})
+    for column, dtype in snapshot_columns.items():
+        values = pd.Series(buffers.pop(column), dtype=object).replace('', None)
+        if dtype == 'string':
+            df[column] = values.astype('string')
+        else:
+            numbers = pd.to_numeric(values, errors='coerce')
+            # whole number columns drop any decimals, as astype(int) did
+            df[column] = (np.trunc(numbers) if dtype == 'Int64' else numbers).astype(dtype)
     return df
 
-
-def move_between_groups(completed_df, in_process_df, open_df, existing_items):
-    print('moving rows to correct groups...')
-    for index, row in existing_items.iterrows():
-        project_id = str(row['id'])
-        item_group = row['group']
-        item_id = row['item_id']
-        
-        # Check if item_id is not None
-        if project_id is not None:
-        
-            # Check if the item is in 'completed_df' but not marked as 'Complete' on the board
-            if item_group != 'Completed' and project_id in completed_df['text2'].values:
-                monday_data.move_items_between_groups(item_id, completed_group)
-                print(f"{project_id} moved from {item_group} to Completed.")
-            # Do similar checks for 'In Process'
-            elif item_group != 'In Process' and project_id in in_process_df['text2'].values:
-                monday_data.move_items_between_groups(item_id, in_process_group)
-                print(f"{project_id} moved from {item_group} to In Process.")
-            # Check for eligible items that have inputs that would cause an error and move to error group
-            elif item_group == 'Eligible' and (row['numbers'] == "" or row['numbers'] == 0 or row['numbers6']=="" or row['status9'] == 'Escalation'\
-                or pd.isna(row['numbers']) or pd.isna(row['numbers6'])):
-                monday_data.move_items_between_groups(item_id, error_group)
-                print(f"{project_id} moved from {item_group} to Errors.")
-            # Check for items not in eligible group but are currently available and ranked
-            elif item_group != 'Eligible' and project_id in open_df['text2'].values and (row['numbers'] != "" and row['numbers'] != 0 and \
-                row['numbers6']!="" and row['status9'] != 'Escalation') and (row['numbers_15'] >=0 or row['status9']=='EMERGENCY' or row['status9']=='High'):
-                monday_data.move_items_between_groups(item_id, eligible_group)
-                print(f"{project_id} moved from {item_group} to Eligible.")  # replace group IDs with actual IDs
-            elif item_group == 'Eligible' and row['numbers_15'] < 0 and row['status9']!='EMERGENCY' and row['status9']!='High':
-                monday_data.move_items_between_groups(item_id, ineligible_group)
-                print(f"{project_id} moved from {item_group} to Ineligible.") 
-
-def create_missing_items(completed_df, in_process_df, open_df, existing_items):
-    print('adding new projects...')
-    existing_ids = set(existing_items['id'])
-
-    for df, group in [(completed_df, completed_group), 
-                      (in_process_df, in_process_group), 
-                      (open_df, eligible_group)]:
-        # Go through each item in the dataframe
-        for index, row in df.iterrows():
-            item_id = row['text2']
-
-            # If the item id is not in the list of existing ids, create a new item
-            if item_id not in existing_ids:
-                print(f'adding {item_id}')
-                monday_data.create_items_from_df(row, group, error_group, ineligible_group)
-
-def update_existing_data(preprocessed_df, existing_items):
-    existing_items = existing_items.to_dict(orient='records')
-
-    print(f"Type of existing_items: {type(existing_items)}")  # Debug print 1
-    count = 1
-    # Loop through each item in preprocessed_df
-    for index, row in preprocessed_df.iterrows():
-        matching_items = [item for item in existing_items if int(item['id']) == int(row['text2'])]
-        if matching_items:
-            matching_item = matching_items[0]
-            for column in columns_to_check:
-                # Handle 'status9' specially
-                if column == 'status9':
-
-                    existing_status_text = matching_item[column]
-                    new_status_text = row[column]['text']
-                    if existing_status_text != new_status_text:
-                        if row[column]['value'] == {}:
-                            value = status_mapping['']
-                        else:
-                            value = row[column]['value']['value']
-                        monday_data.change_item_value(new_board_id, matching_item['item_id'], column, value)
-                        print(f"value {row['text2']} changed in {column} from {existing_status_text} to {new_status_text}. Values changed: {count}.")
-                        count += 1
-                else:
-                    # Convert string values to their appropriate type before comparison
-                    value = matching_item[column]
-                    if isinstance(value, float):
-                        existing_value = value
-                    elif isinstance(value, str) and value.isdigit():
-                        existing_value = int(value)
-                    else:
-                        try:
-                            # try converting to a float (will fail if the string is not a number)
-                            existing_value = float(value)
-                        except ValueError:
-                            # if it's not a number, keep it as a string
-                            existing_value = value
-
-                    if row[column] != existing_value and column != 'status9':
-                        if pd.isna(row[column]):
-                            continue
-                        monday_data.change_item_value(new_board_id, matching_item['item_id'], column, row[column])
-                        print(f"value {row['text2']} changed in {column} from {existing_value} to {row[column]}. Values changed: {count}.")
-                        count += 1
-
-def delete_missing_items(completed_df, in_process_df, open_df, existing_items):
-    # Combine the ids from completed_df, in_process_df, and open_df
-    current_ids = set(completed_df['text2']).union(set(in_process_df['text2'])).union(set(open_df['text2']))
-
-    # Find items in existing_items that are not in current_ids
-    missing_items = existing_items[~existing_items['id'].isin(current_ids)]
-    print(len(missing_items), ' items to be deleted.')
-    # Delete the missing items from the new board
-    for _, item in missing_items.iterrows():
-        monday_data.delete_item(item['item_id'])
-        print(f"Deleted item with id: {item['item_id']} from the new board.")
\ No newline at end of file
+def board_after_mutations(existing_items, applied):
+    """
+    Ranking board snapshot after the board mutations in applied (see execute_mutations), so updates can be planned
+    without fetching the board again. Deleted items are dropped, moved items take the group Monday returned and
+    created items are added with the column values Monday returned.
+    """
+    deleted = {mutation['item_id'] for mutation in applied if mutation['op'] == 'delete'}
+    moved = {mutation['item_id']: mutation['result']['group']['title'] for mutation in applied if mutation['op'] == 'move'}
+    board = existing_items[~existing_items['item_id'].isin(deleted)].copy()
+    board['group'] = board['item_id'].map(moved).fillna(board['group'])
+    created = existing_rows([mutation['result'] for mutation in applied if mutation['op'] == 'create'])
+    print(f'{len(created)} created items added to the Ranking board snapshot.')
+    return pd.concat([board, created], ignore_index=True)
+
+
+def error_items(df):
+    """
+    Rows whose cost or rank is blank or whose priority is Escalation, which belong in the Errors group.
+    """
+    return ((df['numbers'] == "") | (df['numbers'] == 0) | (df['numbers6'] == "") | (df['status9'] == 'Escalation')
+            | df['numbers'].isna() | df['numbers6'].isna()).fillna(False).astype(bool)
+
+def plan_board(completed_df, in_process_df, open_df, existing_items):
+    """
+    Deletes, group moves and creates needed on the Ranking board, planned from one snapshot from
+    find_existing_rows and the preprocessed frames with set and hash joins on the project id.
+    Items whose project is no longer on the project board are deleted, and so are duplicate items of a project:
+    the first is kept, as build_changeset matches it. Only kept items are moved.
+    """
+    completed_ids, in_process_ids, open_ids = (set(df['text2']) for df in [completed_df, in_process_df, open_df])
+    items = existing_items.assign(key=existing_items['id'].astype(str))
+    current = items['key'].isin(completed_ids | in_process_ids | open_ids)
+    duplicate = current & items['key'].duplicated()
+
+    missing = items[~current]
+    print(len(missing), ' items to be deleted.')
+    plan = [{'op': 'delete', 'item_id': item_id, 'message': f"Deleted item with id: {item_id} from the new board."}
+            for item_id in missing['item_id']]
+    plan += [{'op': 'delete', 'item_id': item_id, 'message': f"Deleted duplicate item {item_id} of {project_id}."}
+             for item_id, project_id in zip(items.loc[duplicate, 'item_id'], items.loc[duplicate, 'key'])]
+
+    # the first rule that matches an item decides its group
+    kept = items[current & ~duplicate]
+    group = kept['group']
+    error = error_items(kept)
+    always_eligible = kept['status9'].isin(['EMERGENCY', 'High'])
+    fund_left = kept['numbers_15'].fillna(0) # a blank remaining fund budget counts as 0
+    rules = [
+        ((group != 'Completed') & kept['key'].isin(completed_ids), completed_group, 'Completed'),
+        ((group != 'In Process') & kept['key'].isin(in_process_ids), in_process_group, 'In Process'),
+        ((group == 'Eligible') & error, error_group, 'Errors'),
+        ((group != 'Eligible') & kept['key'].isin(open_ids) & ~error & ((fund_left >= 0) | always_eligible), eligible_group, 'Eligible'),
+        ((group == 'Eligible') & (fund_left < 0) & ~always_eligible, ineligible_group, 'Ineligible'),
+    ]
+    conditions = [rule.to_numpy(dtype=bool) for rule, _, _ in rules]
+    destination = np.select(conditions, [group_id for _, group_id, _ in rules], default='')
+    title = np.select(conditions, [title for _, _, title in rules], default='')
+    moved = destination != ''
+    plan += [{'op': 'move', 'item_id': item_id, 'group': group_id, 'message': f"{project_id} moved from {item_group} to {group_title}."}
+             for item_id, group_id, project_id, item_group, group_title
+             in zip(kept['item_id'][moved], destination[moved], kept['key'][moved], group[moved], title[moved])]
+
+    # projects not on the board yet, each created once
+    monday_data = get_monday()
+    existing_ids = set(items['key'])
+    for df, group_id in [(completed_df, completed_group), (in_process_df, in_process_group), (open_df, eligible_group)]:
+        new = df[~df['text2'].astype(str).isin(existing_ids)].drop_duplicates(subset='text2')
+        existing_ids |= set(new['text2'].astype(str))
+        if group_id == eligible_group: # same routing as Monday.item_group
+            groups = np.select([error_items(new), new['numbers_15'] < 0], [error_group, ineligible_group], default=eligible_group)
+        else:
+            groups = [group_id] * len(new)
+        plan += [{'op': 'create', 'project_id': row['text2'], 'name': row['name'], 'group': item_group,
+                  'column_values': monday_data.item_column_values(row), 'message': f"added {row['text2']}"}
+                 for row, item_group in zip(new.to_dict('records'), groups)]
+
+    return plan
+
+def status_value(status):
+    """
+    Value written to the status9 column for a priority label.
+    """
+    if status in status_mapping:
+        return status_mapping[status]['value']
+    return status_mapping['']
+
+def build_changeset(preprocessed_df, existing_items):
+    """
+    Compares preprocessed_df with the Ranking board snapshot from find_existing_rows and returns
+    one row per changed cell: item_id, text2, column, old, new and the value to write.
+    Rows are matched through an indexed join on text2 and columns_to_check are compared as whole columns.
+    """
+    changeset_columns = ['item_id', 'text2', 'column', 'old', 'new', 'value']
+
+    # normalise the join keys once, the first board item wins when a project is on the board twice
+    existing = existing_items.copy()
+    existing['key'] = pd.to_numeric(existing['id'], errors='coerce').astype('Int64')
+    existing = existing.dropna(subset=['key']).drop_duplicates(subset='key', keep='first').set_index('key')
+
+    new = preprocessed_df.reset_index(drop=True)
+    new_keys = pd.to_numeric(new['text2'], errors='coerce').astype('Int64')
+    matched = new_keys.isin(existing.index)
+    new = new[matched.values]
+    old = existing.loc[new_keys[matched].values].reset_index(drop=True)
+    row_order = new.index.values
+    new = new.reset_index(drop=True)
+
+    # blank cells compare as empty text
+    text = lambda values: values.astype(object).fillna('').astype(str)
+
+    changes = []
+    for column_order, column in enumerate(columns_to_check):
+        old_values = old[column]
+        if column == 'status9':
+            new_values = new[column].map(lambda status: status['text'])
+            # a blank status on the board is missing, the same as an empty label
+            changed = pd.Series(old_values.fillna('').to_numpy(dtype=object) != new_values.fillna('').to_numpy(dtype=object))
+            values = new_values.map(status_value)
+        else:
+            new_values = new[column]
+            old_numbers = pd.to_numeric(old_values, errors='coerce').astype(float)
+            new_numbers = pd.to_numeric(new_values, errors='coerce').astype(float)
+            both_numbers = old_numbers.notna() & new_numbers.notna()
+            changed = pd.Series(np.where(both_numbers, new_numbers != old_numbers,
+                                         text(new_values) != text(old_values)))
+            changed &= new_values.notna()
+            values = new_values
+
+        changed = changed.values
+        changes.append(pd.DataFrame({
+            'item_id': old['item_id'].values[changed],
+            'text2': new['text2'].values[changed],
+            'column': column,
+            'old': old_values.values[changed],
+            'new': new_values.values[changed],
+            'value': values.values[changed],
+            'row_order': row_order[changed],
+            'column_order': column_order,
+        }))
+
+    changeset = pd.concat(changes, ignore_index=True)
+    changeset = changeset.sort_values(['row_order', 'column_order'], kind='stable')
+    return changeset[changeset_columns].reset_index(drop=True)
+
+def plan_updates(preprocessed_df, existing_items):
+    """
+    One update per Ranking board item with all of its changed columns.
+    """
+    changeset = build_changeset(preprocessed_df, existing_items)
+
+    # changed columns per item, written together in batched mutations
+    updates = {}
+    for count, change in enumerate(changeset.itertuples(index=False), start=1):
+        updates.setdefault(change.item_id, {})[change.column] = change.value
+        print(f"value {change.text2} changed in {change.column} from {change.old} to {change.new}. Values changed: {count}.")
+
+    return [{'op': 'update', 'item_id': item_id, 'column_values': column_values, 'message': f'updated {item_id}'}
+            for item_id, column_values in updates.items()]
+
+def execute_mutations(mutations, journal=None, phase=None, applied=None):
+    """
+    Runs planned mutations against the Ranking board, one kind at a time in the order
+    deletes, moves, creates, updates. Mutations of one kind are independent and run concurrently.
+    When a journal is given, each mutation is marked done in it as soon as its request succeeds.
+    When applied is a list, each mutation that succeeds is added to it with Monday's result, the moved or created
+    item, for board_after_mutations.
+    Returns the number of mutations that failed.
+    """
+    monday_async = get_monday_async()
+    new_board_id = getenv('new_board_id')
+    failed = 0
+
+    def finish(op, batch, results):
+        # records one request's mutations as soon as it completes, so a crash can't lose them
+        nonlocal failed
+        done = []
+        for mutation, result in zip(batch, results):
+            if isinstance(result, Exception):
+                print(f"Error in {op} of {mutation.get('item_id', mutation.get('project_id'))}: {result}")
+                failed += 1
+            else:
+                print(mutation['message'])
+                done.append(mutation)
+                if applied is not None:
+                    applied.append({**mutation, 'result': result})
+        if journal is not None and done:
+            journal.mark_done(phase, done)
+
+    async def tracked(op, mutation, coroutine):
+        try:
+            result = await coroutine
+        except Exception as e:
+            result = e
+        finish(op, [mutation], [result])
+
+    for op in ['delete', 'move', 'create', 'update']:
+        batch = [mutation for mutation in mutations if mutation['op'] == op]
+        if not batch:
+            continue
+
+        if op == 'update':
+            # updates are packed into aliased mutations with a status per item
+            updates = {mutation['item_id']: mutation['column_values'] for mutation in batch}
+
+            def updated(status):
+                part = [mutation for mutation in batch if mutation['item_id'] in status]
+                finish(op, part, [None if status[mutation['item_id']] else Exception(f"not updated: {mutation['column_values']}")
+                                  for mutation in part])
+            asyncio.run(monday_async.change_multiple_values_batch(new_board_id, updates, on_batch=updated))
+        elif op == 'create':
+            # creates are packed into aliased mutations that return the new items with their column values
+            def created(part, items):
+                finish(op, part, [item if item is not None else Exception(f"not created: {mutation['name']}")
+                                  for mutation, item in zip(part, items)])
+            asyncio.run(monday_async.create_items_batch(new_board_id, batch, ['text2'] + list(snapshot_columns), on_batch=created))
+        else:
+            if op == 'delete':
+                coroutines = [tracked(op, mutation, monday_async.delete_item(mutation['item_id'])) for mutation in batch]
+            else:
+                coroutines = [tracked(op, mutation, monday_async.move_item_to_group(mutation['item_id'], mutation['group'])) for mutation in batch]
+            run_concurrently(monday_async, coroutines)
+
+    print(f"{len(mutations) - failed} mutations done, {failed} failed.")
+    return failed
@@ -0,0 +1,77 @@
+import json
+import os
+import shutil
+import pandas as pd
+from monday_functions import json_default
+
+# update variables as needed
+journal_dir = 'mutation_journal'
+
+
+class MutationJournal:
+    """
+    On-disk plan of the Ranking board mutations of a run.
+    Each phase's mutations are written to <phase>_plan.jsonl before any of them runs, and each one is
+    appended to <phase>_done.jsonl as soon as it succeeds, so a crashed run can replay only what is left.
+    The preprocessed frames are saved too, so later phases can be planned on resume without recomputing.
+    """
+    def __init__(self, path=journal_dir):
+        self.path = path
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    def start(self):
+        """
+        Clears the previous run's journal.
+        """
+        if os.path.exists(self.path):
+            shutil.rmtree(self.path)
+        os.makedirs(self.path)
+
+    def exists(self):
+        return os.path.exists(self._file('frames.pkl'))
+
+    def save_frames(self, **frames):
+        pd.to_pickle(frames, self._file('frames.pkl'))
+
+    def load_frames(self):
+        return pd.read_pickle(self._file('frames.pkl'))
+
+    def has_plan(self, phase):
+        return os.path.exists(self._file(f'{phase}_plan.jsonl'))
+
+    def write_plan(self, phase, mutations):
+        """
+        Numbers the mutations and writes them to the phase's plan.
+        """
+        temp_file = self._file(f'{phase}_plan.tmp')
+        with open(temp_file, 'w') as f:
+            for seq, mutation in enumerate(mutations):
+                mutation['seq'] = seq
+                f.write(json.dumps(mutation, default=json_default) + '\n')
+        # the plan only counts once it's fully written
+        os.replace(temp_file, self._file(f'{phase}_plan.jsonl'))
+
+    def mark_done(self, phase, mutations):
+        with open(self._file(f'{phase}_done.jsonl'), 'a') as f:
+            for mutation in mutations:
+                f.write(json.dumps(mutation['seq']) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+    def pending(self, phase):
+        """
+        Mutations of the phase's plan that have not succeeded yet.
+        """
+        with open(self._file(f'{phase}_plan.jsonl')) as f:
+            mutations = [json.loads(line) for line in f]
+
+        done = set()
+        done_file = self._file(f'{phase}_done.jsonl')
+        if os.path.exists(done_file):
+            with open(done_file) as f:
+                # a line cut short by a crash is ignored
+                done = {int(line) for line in f if line.strip().isdigit()}
+
+        return [mutation for mutation in mutations if mutation['seq'] not in done]
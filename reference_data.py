@@ -0,0 +1,108 @@
+import json
+import os
+import time
+import pandas as pd
+from sql_queries import run_sql_query, run_sql_queries, facilities_sql, facilities_dtypes
+
+# update variables as needed
+reference_cache_dir = 'reference_cache'
+ttl_hours = 24 # cached data younger than this is used without checking the database
+budgets_file = 'budgets_2023.csv'
+
+facilities_probe_sql = '''
+    select (select count(*) from facilities) as facilities,
+           (select max(updated_at) from facilities) as facilities_updated,
+           (select count(*) from units where inactive = false) as units,
+           (select max(updated_at) from units) as units_updated
+'''
+
+
+class ReferenceData:
+    """
+    Cache for slow-changing reference tables, kept in memory and pickled to disk.
+    Data younger than the TTL is used as is. Older data is checked with a cheap probe (row counts and last update
+    times) and only reloaded when the probe's result changed. Tables whose probe is cheaper than reading the cache,
+    such as a file's size and modification time, can be given a TTL of 0 so they're probed every time.
+    """
+    def __init__(self, cache_dir=reference_cache_dir, ttl_hours=ttl_hours):
+        self.cache_dir = cache_dir
+        self.ttl = ttl_hours * 3600
+        self.data = {}
+
+    def _paths(self, name):
+        return os.path.join(self.cache_dir, f'{name}.pkl'), os.path.join(self.cache_dir, f'{name}.json')
+
+    def get(self, name, load, probe=None, ttl_hours=None, load_probes=False):
+        """
+        Returns the named table, calling load() only when there is no usable cached copy.
+        probe() returns a small json serializable summary that changes whenever the table does.
+        ttl_hours overrides the cache's TTL for this table. With load_probes=True, load() returns
+        (table, probe result) so the two can be fetched together.
+        """
+        ttl = self.ttl if ttl_hours is None else ttl_hours * 3600
+        if name in self.data:
+            return self.data[name]
+
+        data_path, meta_path = self._paths(name)
+        if os.path.exists(data_path) and os.path.exists(meta_path):
+            with open(meta_path) as f:
+                meta = json.load(f)
+            fresh = time.time() - meta['loaded_at'] < ttl
+            if not fresh and probe is not None and self._probe(probe) == meta['probe']:
+                # nothing changed, so the copy is good for another TTL
+                meta['loaded_at'] = time.time()
+                self._write_meta(meta_path, meta)
+                fresh = True
+            if fresh:
+                self.data[name] = pd.read_pickle(data_path)
+                return self.data[name]
+
+        print(f'loading {name}...')
+        if load_probes:
+            df, probed = load()
+            probed = self._probe(lambda: probed)
+        else:
+            df = load()
+            probed = self._probe(probe) if probe else None
+        os.makedirs(self.cache_dir, exist_ok=True)
+        df.to_pickle(data_path)
+        self._write_meta(meta_path, {'loaded_at': time.time(), 'probe': probed})
+        self.data[name] = df
+        return df
+
+    def _probe(self, probe):
+        # round trip through json so it compares equal to the stored value
+        return json.loads(json.dumps(probe(), default=str))
+
+    def _write_meta(self, meta_path, meta):
+        with open(meta_path, 'w') as f:
+            json.dump(meta, f)
+
+
+reference_data = ReferenceData()
+
+def facility_ages(facilities):
+    """
+    Recomputes the columns facilities_sql works out from now(), which go stale while the table sits in the cache.
+    """
+    now = pd.Timestamp.now(tz=facilities['acquisition_date'].dt.tz)
+    facilities['age_of_facility'] = (now - facilities['acquisition_date']).dt.days
+    facilities['same_store'] = facilities['acq_date'] <= now.tz_localize(None) - pd.DateOffset(months=24)
+    return facilities
+
+def get_facilities():
+    def load():
+        # the probe is stored with the data, so it runs alongside the load
+        results = run_sql_queries({'facilities': facilities_sql, 'probe': facilities_probe_sql},
+                                  dtypes={'facilities': facilities_dtypes})
+        return results['facilities'], results['probe'].iloc[0].tolist()
+    facilities = reference_data.get('facilities', load, probe=lambda: run_sql_query(facilities_probe_sql).iloc[0].tolist(),
+                                    load_probes=True)
+    return facility_ages(facilities)
+
+def get_budgets():
+    def file_stats():
+        stat = os.stat(budgets_file)
+        return [stat.st_mtime, stat.st_size]
+    # the file is edited by hand and stat is cheap, so it's checked on every run
+    return reference_data.get('budgets', lambda: pd.read_csv(budgets_file), probe=file_stats, ttl_hours=0)
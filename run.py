@@ -1,35 +1,60 @@
-from monday_push_helpers import calc_and_sort, preprocessing, find_existing_rows, \
-    move_between_groups, create_missing_items, update_existing_data, delete_missing_items
-import time 
-initial = time.time()
+from monday_push_helpers import calc_and_sort, preprocessing, find_existing_rows, board_after_mutations, \
+    plan_board, plan_updates, execute_mutations
+from mutation_journal import MutationJournal
+from instrumentation import start_run, stage, finish_run
+import sys
 
-# runs the ranking optimization over the available projects
-# also calculates remaining budgets
-open_df, in_process_df, completed_df = calc_and_sort() # takes a few mins to fetch from project board
-print('calc_and_sort() took', round((time.time()-initial)/60,2), 'minutes.')
-# preps data to match with monday's column ids and data types
-proc_df_in_process, proc_open_df, proc_completed = preprocessing(in_process_df, open_df, completed_df)
+# python run.py --resume replays the unfinished mutations of the last run instead of starting over
+resume = '--resume' in sys.argv
+# python run.py --profile=cprofile (or tracemalloc) also profiles every stage into the run report
+profile = next((arg.split('=', 1)[1] for arg in sys.argv if arg.startswith('--profile=')), None)
+start_run(profile)
+journal = MutationJournal()
+existing_items = None
 
-existing_items = find_existing_rows()
-delete_missing_items(proc_completed, proc_df_in_process, proc_open_df, existing_items)
+if resume and journal.exists():
+    print('Resuming from the mutation journal...')
+    frames = journal.load_frames()
+    proc_df_in_process, proc_open_df, proc_completed = frames['in_process'], frames['open'], frames['completed']
+else:
+    # runs the ranking optimization over the available projects
+    # also calculates remaining budgets
+    with stage('calc_and_sort'):
+        open_df, in_process_df, completed_df = calc_and_sort() # takes a few mins to fetch from project board
+    # preps data to match with monday's column ids and data types
+    with stage('preprocessing'):
+        proc_df_in_process, proc_open_df, proc_completed = preprocessing(in_process_df, open_df, completed_df)
+    journal.start()
+    journal.save_frames(in_process=proc_df_in_process, open=proc_open_df, completed=proc_completed)
 
-# cleans items between groups. (ie. if an item is completed, it will remove it from the original group 
-#   and add it to the completed group.)
-start = time.time()
-move_between_groups(proc_completed, proc_df_in_process, proc_open_df, existing_items) 
-print('move_between_groups() took', round((time.time()-start)/60,2), 'minutes.')
+if not journal.has_plan('board'):
+    with stage('plan_board'):
+        existing_items = find_existing_rows()
+        # deletes items no longer on the project board and duplicate items, cleans items between groups (ie. if an
+        #   item is completed, it will remove it from the original group and add it to the completed group.) and adds
+        #   any items that are on the project board but not in the Ranking board
+        journal.write_plan('board', plan_board(proc_completed, proc_df_in_process, proc_open_df, existing_items))
 
-start = time.time()
-# looks for any items that are on the project board that are not in the Ranking board and adds them
-create_missing_items(proc_completed, proc_df_in_process, proc_open_df, existing_items)
-print('create_missing_items() took', round((time.time()-start)/60,2), 'minutes.')
+applied = []
+with stage('board_mutations'):
+    execute_mutations(journal.pending('board'), journal, 'board', applied)
 
-existing_items = find_existing_rows() #removed this after fixing status for new projects
-start = time.time()
-print('Updating In Process Items')
-update_existing_data(proc_df_in_process, existing_items)
-print('Updating Eligible Items')
-update_existing_data(proc_open_df, existing_items)
-print('update_existing_data() took', round((time.time()-start)/60,2), 'minutes.')
+if not journal.has_plan('update'):
+    with stage('plan_updates'):
+        # the board as this run's mutations left it, fetched again only when resuming a plan made by an earlier run
+        if existing_items is None:
+            existing_items = find_existing_rows()
+        else:
+            existing_items = board_after_mutations(existing_items, applied)
+        print('Updating In Process Items')
+        updates = plan_updates(proc_df_in_process, existing_items)
+        print('Updating Eligible Items')
+        updates += plan_updates(proc_open_df, existing_items)
+        journal.write_plan('update', updates)
 
-print('Algorithm took', round((time.time()-initial)/60,2), 'minutes total.')
+with stage('update_mutations'):
+    failed = execute_mutations(journal.pending('update'), journal, 'update')
+if failed:
+    print('Some mutations failed. Run python run.py --resume to retry them.')
+
+finish_run()
@@ -0,0 +1,213 @@
+import itertools
+import numpy as np
+import pandas as pd
+import algo
+import helpers
+import monday_push_helpers
+from algo import calc_cost_effectiveness
+from helpers import add_values_to_projects, categorize_projects, grab_budgets
+from monday_push_helpers import fetch_data, split_data, pending_statuses
+from reference_data import get_facilities
+
+# update variables as needed
+snapshot_path = 'scenario_snapshot.pkl'
+priority_parameters = ['low_min', 'low_max', 'medium_min', 'medium_max', 'high_min', 'high_max', 'emergency_min', 'emergency_max']
+always_eligible = ['EMERGENCY', 'High'] # eligible whatever the budget (see plan_board)
+
+
+def take_snapshot(path=snapshot_path):
+    """
+    Fetches everything the ranking reads (projects, facilities, budgets and unit values) once and saves it,
+    so scenarios can be run without going back to Monday, Postgres or S3.
+    """
+    completed_df, open_df = fetch_data()
+    open_df = categorize_projects(open_df, pending_statuses)
+    df_in_process, df_pending = split_data(open_df)
+    facilities = get_facilities()
+    snapshot = {'completed': completed_df, 'in_process': df_in_process, 'pending': df_pending,
+                'budgets': grab_budgets(facilities), 'values': add_values_to_projects()}
+    pd.to_pickle(snapshot, path)
+    return snapshot
+
+
+def load_snapshot(path=snapshot_path):
+    return pd.read_pickle(path)
+
+
+def parameter_grid(**values):
+    """
+    Every combination of the given parameter values, e.g. parameter_grid(high_min=[8000, 9000], capex_threshold=[2500, 5000]).
+    """
+    names = list(values)
+    return [dict(zip(names, combination)) for combination in itertools.product(*values.values())]
+
+
+def current_parameters():
+    """
+    The parameters the pipeline uses now, from algo.py and monday_push_helpers.py.
+    """
+    parameters = {name: getattr(algo, name) for name in priority_parameters}
+    parameters['capex_threshold'] = monday_push_helpers.capex_threshold
+    return parameters
+
+
+def grouped_cumsum(values, groups, order):
+    """
+    Running totals of values within each group, taken in order, for every scenario at once.
+    values and order are (scenarios, projects) arrays, groups holds one group number per project, -1 for none.
+    """
+    n_scenarios, n = values.shape
+    position = np.empty_like(order)
+    np.put_along_axis(position, order, np.arange(n)[None, :].repeat(n_scenarios, axis=0), axis=1)
+
+    # sort every scenario by group, then by order, so each group's projects are next to each other
+    by_group = np.argsort(groups[None, :] * n + position, axis=1, kind='stable')
+    sorted_values = np.take_along_axis(values, by_group, axis=1)
+    sorted_groups = groups[by_group]
+    totals = np.cumsum(sorted_values, axis=1)
+    starts = np.ones_like(sorted_groups, dtype=bool)
+    starts[:, 1:] = sorted_groups[:, 1:] != sorted_groups[:, :-1]
+    # values are never negative, so the total before each group's start only grows
+    before = np.maximum.accumulate(np.where(starts, totals - sorted_values, 0), axis=1)
+
+    result = np.empty_like(values)
+    np.put_along_axis(result, by_group, totals - before, axis=1)
+    return np.where(groups[None, :] < 0, 0, result)
+
+
+class ScenarioEngine:
+    """
+    Re-ranks a snapshot's pending projects under many parameter sets at once.
+    The parts that don't depend on the parameters (costs, days open, unit value factors, budgets and what was spent)
+    are computed once. Each scenario is then a row of (scenarios, projects) arrays: priority values, cost
+    effectiveness, ranks, the budget left per facility and fund, and eligibility.
+
+    Scenarios can change the priority ranges of algo.py and capex_threshold. As in the pipeline, capex_threshold
+    only decides whether a pending project draws on Capex or R&M; what was spent is split at helpers.capex_threshold.
+    buffer is left out because it only changes the in-process 'cost' column, which the budgets don't read
+    (they use 'Final Cost').
+    Projects with the same cost effectiveness are funded in rank order, and projects that cost nothing get a cost
+    effectiveness of 0.
+    """
+    def __init__(self, snapshot):
+        projects = calc_cost_effectiveness(snapshot['pending'], snapshot['values'])
+        self.projects = projects[['id', 'RD', 'Priority', 'Task Type', 'cost']].astype({'RD': object}).reset_index(drop=True)
+        self.days = projects['days'].to_numpy(dtype=float)
+        self.alpha = projects['alpha'].fillna(1).to_numpy(dtype=float)
+        self.cost = projects['cost'].to_numpy(dtype=float)
+        self.priority = projects['Priority'].to_numpy()
+
+        budgets = snapshot['budgets'].drop_duplicates('RD').reset_index(drop=True)
+        self.rds = {rd: i for i, rd in enumerate(budgets['RD'])}
+        self.funds = {fund: i for i, fund in enumerate(budgets['fund'].dropna().unique())}
+        # budget per facility, R&M in column 0 and Capex in column 1, as remaining_facility picks them
+        self.budget = budgets[['R&M budget', 'recast_capex']].to_numpy(dtype=float)
+        self.budget_fund = budgets['fund'].map(self.funds).fillna(-1).astype(int).to_numpy()
+
+        # final costs spent so far, completed and in-process projects as in the expected budgets
+        spent = pd.concat([snapshot['completed'], snapshot['in_process']], ignore_index=True)
+        spent = spent[spent['RD'].isin(self.rds)]
+        self.final_cost = pd.to_numeric(spent['Final Cost'], errors='coerce').fillna(0).to_numpy()
+        self.final_cost_rd = spent['RD'].astype(object).map(self.rds).to_numpy()
+        # budget left per facility and fund, the same for every scenario
+        self.remaining, self.remaining_fund = self.remaining_budgets()
+
+        self.project_rd = self.projects['RD'].map(self.rds).fillna(-1).astype(int).to_numpy()
+        # projects take their fund from their facility
+        self.project_fund = np.where(self.project_rd >= 0, self.budget_fund[self.project_rd], -1)
+        rd_codes = {rd: i for i, rd in enumerate(self.projects['RD'].unique())}
+        self.project_rd_group = self.projects['RD'].map(rd_codes).to_numpy()
+
+    def priority_values(self, parameters):
+        """
+        priority_values for every scenario, whole numbers as in algo, scaled by the unit value factor.
+        """
+        n = len(self.cost)
+        minimum = np.full((len(parameters), n), np.nan)
+        maximum = np.full((len(parameters), n), np.nan)
+        for level, prefix in [('Low', 'low'), ('Medium', 'medium'), ('High', 'high'), ('EMERGENCY', 'emergency')]:
+            mask = self.priority == level
+            minimum[:, mask] = parameters[f'{prefix}_min'].to_numpy()[:, None]
+            maximum[:, mask] = parameters[f'{prefix}_max'].to_numpy()[:, None]
+        days = self.days[None, :]
+        values = np.trunc(np.where(days <= 730, minimum + days * ((maximum - minimum) / 730), maximum))
+        return values * self.alpha[None, :]
+
+    def remaining_budgets(self):
+        """
+        Budget left per facility and per fund, as (facilities, 2) and (funds, 2) arrays with R&M at 0 and Capex at 1.
+        Spending is split into Capex and R&M at helpers.capex_threshold, as remaining_facility does.
+        """
+        n_rds = len(self.rds)
+        capex = self.final_cost >= helpers.capex_threshold
+        spent = np.bincount(self.final_cost_rd * 2 + capex, weights=self.final_cost, minlength=n_rds * 2).reshape(n_rds, 2)
+        remaining = self.budget - spent
+
+        # a fund's budget is its facilities' budgets, facilities without one add nothing
+        remaining_fund = np.zeros((len(self.funds), 2))
+        in_fund = self.budget_fund >= 0
+        np.add.at(remaining_fund, self.budget_fund[in_fund], np.where(np.isnan(self.budget), 0, self.budget)[in_fund] - spent[in_fund])
+        return remaining, remaining_fund
+
+    def evaluate(self, parameters):
+        """
+        Ranks the pending projects under every row of parameters, a DataFrame with all the parameters.
+        Returns a dictionary of (scenarios, projects) arrays: rank, remaining_budget_by_rd, remaining_budget_by_fund
+        and eligible.
+        """
+        n_scenarios, n = len(parameters), len(self.cost)
+        thresholds = parameters['capex_threshold'].to_numpy(dtype=float)
+
+        values = self.priority_values(parameters)
+        cost = np.broadcast_to(self.cost, (n_scenarios, n))
+        effectiveness = np.divide(values, cost, out=np.zeros_like(values), where=cost != 0)
+        # highest cost effectiveness first, projects without a priority last
+        order = np.argsort(np.where(np.isnan(effectiveness), np.inf, -effectiveness), axis=1, kind='stable')
+        rank = np.empty((n_scenarios, n), dtype=int)
+        np.put_along_axis(rank, order, np.arange(1, n + 1)[None, :].repeat(n_scenarios, axis=0), axis=1)
+        rated = ~np.isnan(effectiveness)
+        rank = np.where(rated, rank, rated.sum(axis=1, keepdims=True) + 1)
+
+        capex = (cost > thresholds[:, None]).astype(int)
+        rd_budget = np.where(self.project_rd >= 0, self.remaining[self.project_rd, capex], 0)
+        fund_budget = np.where(self.project_fund >= 0, self.remaining_fund[self.project_fund, capex], 0)
+        rd_budget = np.nan_to_num(rd_budget).astype(int)
+        fund_budget = np.nan_to_num(fund_budget).astype(int)
+
+        remaining_by_rd = rd_budget - np.trunc(grouped_cumsum(cost.copy(), self.project_rd_group, order)).astype(int)
+        remaining_by_fund = fund_budget - np.trunc(grouped_cumsum(cost.copy(), self.project_fund, order)).astype(int)
+        eligible = (remaining_by_fund >= 0) | np.isin(self.priority, always_eligible)[None, :]
+        return {'rank': rank, 'remaining_budget_by_rd': remaining_by_rd, 'remaining_budget_by_fund': remaining_by_fund,
+                'eligible': eligible}
+
+    def run(self, scenarios, base=None):
+        """
+        Ranks the pending projects under each scenario, a list of dictionaries of parameters to change.
+        Parameters a scenario leaves out, and the base the differences are measured against, are the current ones
+        (or base, a dictionary of parameters).
+        Returns (summary, changes): one summary row per scenario, and one row per scenario and project whose rank
+        or eligibility differs from the base.
+        """
+        base = {**current_parameters(), **(base or {})}
+        parameters = pd.DataFrame([base] + [{**base, **scenario} for scenario in scenarios])
+        results = self.evaluate(parameters)
+        rank, eligible = results['rank'], results['eligible']
+
+        rank_change = rank - rank[0]
+        eligibility_change = eligible != eligible[0]
+        summary = parameters.assign(
+            eligible=eligible.sum(axis=1), exceeds_facility_budget=(results['remaining_budget_by_rd'] < 0).sum(axis=1),
+            rank_changes=(rank_change != 0).sum(axis=1), newly_eligible=(eligibility_change & eligible).sum(axis=1),
+            no_longer_eligible=(eligibility_change & ~eligible).sum(axis=1),
+        )
+        summary.index.name = 'scenario' # 0 is the base
+
+        scenario, project = np.nonzero((rank_change != 0) | eligibility_change)
+        changes = self.projects.iloc[project].reset_index(drop=True).assign(
+            scenario=scenario, base_rank=rank[0, project], rank=rank[scenario, project],
+            rank_change=rank_change[scenario, project], base_eligible=eligible[0, project],
+            eligible=eligible[scenario, project],
+            remaining_budget_by_rd=results['remaining_budget_by_rd'][scenario, project],
+            remaining_budget_by_fund=results['remaining_budget_by_fund'][scenario, project],
+        )
+        return summary, changes
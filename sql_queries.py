@@ -1,47 +1,137 @@
-import psycopg2 
 import pandas as pd
-from dotenv import load_dotenv
-import os 
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import os
+from config import getenv
+from instrumentation import call
 
-load_dotenv()
-HOST = os.getenv("POSTGRES_HOST")
-DB = os.getenv("POSTGRES_DB")
-PORT = os.getenv("POSTGRES_PORT")
-USER = os.getenv("POSTGRES_USER")
-PASSWORD = os.getenv("POSTGRES_PASSWORD")
+max_connections = 4 # connections kept open by the pool, also the number of queries run at once
 
+connection_pool = None
+pool_lock = threading.Lock()
+
+
+def connection_settings():
+    return {
+        'host': getenv("POSTGRES_HOST"),
+        'database': getenv("POSTGRES_DB"),
+        'port': getenv("POSTGRES_PORT"),
+        'user': getenv("POSTGRES_USER"),
+        'password': getenv("POSTGRES_PASSWORD"),
+    }
 
 def get_sql_connection():
-    conn = psycopg2.connect(
-        host=HOST,
-        database=DB,
-        port=PORT,
-        user=USER,
-        password=PASSWORD
-    )
+    import psycopg2 
+    conn = psycopg2.connect(**connection_settings())
 
     return conn 
 
-def run_sql_query(sql_query):
-    conn = get_sql_connection()
-    df = pd.read_sql_query(sql_query, conn)
-    conn.close()
+def get_connection_pool():
+    # connections are opened on first use and reused for the rest of the process
+    from psycopg2 import pool
+    global connection_pool
+    with pool_lock:
+        if connection_pool is None:
+            connection_pool = pool.ThreadedConnectionPool(0, max_connections, **connection_settings())
+    return connection_pool
+
+def query_label(sql_query):
+    # start of the query, enough to tell queries apart in the run report
+    return ' '.join(sql_query.split())[:80]
+
+def run_sql_query(sql_query, params=None):
+    sql_pool = get_connection_pool()
+    conn = sql_pool.getconn()
+    try:
+        with call('sql', 'run_sql_query') as record:
+            record['query'] = query_label(sql_query)
+            df = pd.read_sql_query(sql_query, conn, params=params)
+            record['rows'] = len(df)
+        # end the read transaction so the connection goes back to the pool idle
+        conn.rollback()
+    except Exception:
+        sql_pool.putconn(conn, close=True)
+        raise
+    sql_pool.putconn(conn)
     
     return df 
 
-tasks_to_units = '''
-	select f.site_code, u.unit_number, t.id as task_id, u.occupied
-    from units u 
-    inner join facilities f on f.id = u.facility_id
-    inner join tasks t on t.taskable_id = u.id and t.taskable_type = 'Unit'
-'''
+def copy_sql_query(sql_query, dtype=None, params=None):
+    """
+    Bulk loads a large result set with COPY ... TO STDOUT.
+    Postgres streams the rows as CSV through a pipe straight into pandas' C parser, which builds typed
+    columns (dtype, e.g. category for repeated codes, datetime64[ns] for dates) without materialising a
+    Python tuple per row. params are bound into the query as in run_sql_query.
+    """
+    dtype = dict(dtype or {})
+    parse_dates = [column for column, column_type in dtype.items() if str(column_type).startswith('datetime')]
+    for column in parse_dates:
+        del dtype[column]
+    sql_pool = get_connection_pool()
+    conn = sql_pool.getconn()
+    read_fd, write_fd = os.pipe()
+    errors = []
 
-units_sql = '''
-	select f.site_code as rd, u.unit_number, u.width, u.length, ut.key as unit_type
-    from units u 
+    def copy_rows():
+        # runs in its own thread so pandas parses while Postgres is still sending rows
+        with os.fdopen(write_fd, 'w') as writer:
+            try:
+                with conn.cursor() as cursor:
+                    query = cursor.mogrify(sql_query.strip().rstrip(';'), params).decode() if params else sql_query.strip().rstrip(';')
+                    cursor.copy_expert("COPY (%s) TO STDOUT WITH (FORMAT csv, HEADER true)" % query, writer)
+            except Exception as e:
+                errors.append(e)
+
+    copy_thread = threading.Thread(target=copy_rows)
+    with call('sql', 'copy_sql_query') as record:
+        record['query'] = query_label(sql_query)
+        copy_thread.start()
+        try:
+            with os.fdopen(read_fd, 'r') as reader:
+                # Postgres writes booleans as t/f in CSV
+                df = pd.read_csv(reader, dtype=dtype, parse_dates=parse_dates, true_values=['t'], false_values=['f'])
+        except Exception as e:
+            errors.append(e)
+        copy_thread.join()
+        if errors:
+            record['error'] = str(errors[0])[:200]
+        else:
+            record['rows'] = len(df)
+
+    if errors:
+        sql_pool.putconn(conn, close=True)
+        raise errors[0]
+    conn.rollback()
+    sql_pool.putconn(conn)
+
+    return df
+
+def run_sql_queries(queries, dtypes={}):
+    """
+    Runs several queries at once on pooled connections.
+    queries is a dictionary of name -> sql, the result is a dictionary of name -> DataFrame.
+    Queries named in dtypes are bulk loaded with copy_sql_query using those column types.
+    """
+    with ThreadPoolExecutor(max_workers=max_connections) as executor:
+        futures = {}
+        for name, sql_query in queries.items():
+            if name in dtypes:
+                futures[name] = executor.submit(copy_sql_query, sql_query, dtypes[name])
+            else:
+                futures[name] = executor.submit(run_sql_query, sql_query)
+        return {name: future.result() for name, future in futures.items()}
+
+# units of the given tasks (%(task_ids)s, a list of task ids), with their facility, size and type
+unit_values_for_tasks_sql = '''
+	select t.id as task_id, f.site_code as rd, u.unit_number, u.occupied, u.width, u.length, ut.key as unit_type
+    from tasks t
+    inner join units u on u.id = t.taskable_id
     inner join facilities f on f.id = u.facility_id
-    inner join unit_types ut on ut.id = u.unit_type_id
+    left join unit_types ut on ut.id = u.unit_type_id
+    where t.taskable_type = 'Unit' and t.id = any(%(task_ids)s)
 '''
+unit_values_for_tasks_dtypes = {'task_id': 'int64', 'rd': 'category', 'unit_number': 'str', 'width': 'float64',
+                                'length': 'float64', 'unit_type': 'category'} # occupied is parsed from t/f
 
 facilities_sql = '''
 with acquisition_dates as (
@@ -121,4 +211,7 @@ from facilities f
 where f.id != 48 
 group by f.site_code, f.id, s.name, acquisition_date , age_of_facility , a.street, a.street_2 , a.city, a.state, a.zip, latitude, longitude, r.name, f.fund, ad.acq_date 
 order by f.site_code ;
-'''
\ No newline at end of file
+'''
+facilities_dtypes = {'facility_id': 'int64', 'rd': 'str', 'acq_date': 'datetime64[ns]', 'region': 'str', 'fund': 'str',
+                     'fs': 'str', 'acquisition_date': 'datetime64[ns]', 'street': 'str', 'street_2': 'str', 'city': 'str',
+                     'state': 'str', 'zip': 'str'} # same_store is parsed from t/f
@@ -0,0 +1,83 @@
+"""
+Checks the vectorized scoring in algo against the row-wise implementation it replaced.
+"""
+from datetime import date
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import algo
+from benchmarks.load_harness import repo_dir
+from benchmarks.microbenchmarks import generate_facilities, generate_projects, generate_unit_values
+
+
+def baseline_calc_cost_effectiveness(df, values):
+    # calc_cost_effectiveness as it was before scoring was vectorized, with the unit values passed in
+    now = date.today()
+    df = df.copy()
+    df.loc[:, 'days'] = (now - df['Open']).apply(lambda x: x.days)
+    df['days'] = df['days'].astype(int)
+
+    df['cost'] = df.apply(algo.find_cost, axis=1)
+    df['Quantity'] = df['Quantity'].replace('', 1).fillna(1).astype(float)
+    df['cost'] = df['cost'].astype(float)
+    df = df.merge(algo.get_cost_matrix(), on=['Project Type', 'Sub Project Type', 'Task Type'], how='left')
+    df.loc[df['cost'] == 0, 'cost'] = df['Quantity'] * df['Avg Cost']
+    df['cost'] = pd.to_numeric(df['cost'].fillna(0), errors='coerce').round(2)
+    df = df.drop(columns=['Avg Cost'])
+
+    values = values.copy()
+    avg_value = values['replace_value'].mean()
+    values.loc[values['occupied'] == True, 'replace_value'] = values['replace_value'].max()
+    alpha = (values[['item_id', 'replace_value']].groupby(['item_id']).mean() / avg_value).reset_index()
+    alpha = alpha.rename(columns={'item_id': 'id', 'replace_value': 'alpha'})
+
+    mask = df['Task Type'] == 'Unit'
+    df_unit = df[mask].merge(alpha, on='id', how='left')
+    df_unit['alpha'] = df_unit['alpha'].fillna(1)
+    df_unit['priority_value'] = df_unit.apply(algo.priority_value, axis=1) * df_unit['alpha']
+    df_not_unit = df[~mask].copy()
+    df_not_unit['priority_value'] = df_not_unit.apply(algo.priority_value, axis=1)
+    df = pd.concat([df_unit, df_not_unit])
+
+    df['cost_effectiveness'] = np.divide(df['priority_value'].astype(float), df['cost'],
+                                         out=np.zeros(len(df)), where=df['cost'] != 0)
+    df['rank'] = df['cost_effectiveness'].rank(method='first', ascending=False).astype(int)
+    return df
+
+
+@pytest.fixture
+def projects(monkeypatch):
+    monkeypatch.chdir(repo_dir) # get_cost_matrix reads cost_matrix.csv from the working directory
+    rng = np.random.default_rng(0)
+    projects = generate_projects(5000, generate_facilities(rng), rng)
+    # opened within the last 1000 days, so both parts of the priority curve are used
+    projects['Open'] = (pd.Timestamp(date.today()) - pd.to_timedelta(rng.integers(0, 1000, len(projects)), unit='D')).date
+    return projects, generate_unit_values(projects, rng)
+
+
+def test_priority_values_match_priority_value():
+    days = np.arange(0, 1000)
+    for priority in ['Low', 'Medium', 'High', 'EMERGENCY']:
+        expected = [algo.priority_value({'Priority': priority, 'days': day}) for day in days]
+        np.testing.assert_array_equal(algo.priority_values([priority] * len(days), days), expected)
+    assert np.isnan(algo.priority_values(['Other'], [10])).all()
+
+
+def test_calc_cost_effectiveness_matches_baseline(projects):
+    projects, values = projects
+    expected = baseline_calc_cost_effectiveness(projects, values).set_index('id')
+    result = algo.calc_cost_effectiveness(projects, values).set_index('id').loc[expected.index]
+
+    np.testing.assert_array_equal(result['days'], expected['days'])
+    np.testing.assert_array_equal(result['cost'], expected['cost'])
+    np.testing.assert_array_equal(result['priority_value'], expected['priority_value'].astype(float))
+    np.testing.assert_array_equal(result['cost_effectiveness'], expected['cost_effectiveness'])
+    np.testing.assert_array_equal(result['rank'], expected['rank'])
+
+    # projects that cost nothing have a cost effectiveness of 0 and rank after every priced project
+    free = result['cost'] == 0
+    assert free.any()
+    assert (result.loc[free, 'cost_effectiveness'] == 0).all()
+    assert result.loc[free, 'rank'].min() > result.loc[~free, 'rank'].max()
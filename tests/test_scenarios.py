@@ -0,0 +1,46 @@
+"""
+Checks that ScenarioEngine ranks and budgets the pending projects as the pipeline does.
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+import monday_push_helpers
+from algo import calculate_costs, calc_cost_effectiveness
+from benchmarks.load_harness import repo_dir
+from benchmarks.microbenchmarks import generate_facilities, generate_projects, generate_unit_values
+from helpers import grab_budgets
+from monday_push_helpers import calculate_combined_costs, gathered_budgets, merge_budgets, select_projects
+from scenarios import ScenarioEngine, current_parameters
+
+
+def pipeline_pending(snapshot, facilities):
+    # the pending projects' budget columns as calc_and_sort computes them
+    completed = calculate_costs(snapshot['completed'], buffer=1)
+    combined = calculate_combined_costs(snapshot['in_process'].copy(), completed, monday_push_helpers.buffer)
+    df = merge_budgets(calc_cost_effectiveness(snapshot['pending'], snapshot['values']), gathered_budgets(combined, facilities))
+    return select_projects(df)
+
+
+@pytest.mark.parametrize('capex_threshold', [2500, 5000])
+def test_engine_matches_pipeline(monkeypatch, capex_threshold):
+    monkeypatch.chdir(repo_dir) # the cost matrix and budgets are read from the working directory
+    monkeypatch.setattr(monday_push_helpers, 'capex_threshold', capex_threshold)
+    rng = np.random.default_rng(0)
+    facilities = generate_facilities(rng)
+    projects = generate_projects(3000, facilities, rng).drop(columns=['fund'])
+    pending = projects.iloc[1500:].assign(**{'Final Cost': ''})
+    snapshot = {'completed': projects.iloc[:1000], 'in_process': projects.iloc[1000:1500], 'pending': pending,
+                'budgets': grab_budgets(facilities), 'values': generate_unit_values(projects, rng)}
+
+    expected = pipeline_pending(snapshot, facilities).set_index('id')
+    engine = ScenarioEngine(snapshot)
+    results = engine.evaluate(pd.DataFrame([{**current_parameters(), 'capex_threshold': capex_threshold}]))
+    result = pd.DataFrame({name: values[0] for name, values in results.items()}, index=engine.projects['id'])
+    expected = expected.loc[result.index]
+
+    # projects tied on cost effectiveness are funded in either order, and the order they are summed in can
+    # change a total by a cent across a whole dollar
+    unique = ~expected['cost_effectiveness'].duplicated(keep=False) & (expected['cost'] > 0)
+    for column in ['remaining_budget_by_rd', 'remaining_budget_by_fund']:
+        np.testing.assert_allclose(result.loc[unique, column], expected.loc[unique, column], atol=1)